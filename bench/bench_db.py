@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Per-request SQLite overhead: connect-per-call vs the pooled connection layer.
+
+Replays the database work of one authenticated chat request (user lookup,
+last_login update, chat history save) against a throwaway database, once
+with a fresh sqlite3.connect() per call (the old pattern) and once through
+main.db_pool.
+
+Usage: python bench/bench_db.py [--requests 2000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BENCH_DB = os.path.join(tempfile.mkdtemp(prefix="aspiro-bench-"), "bench.db")
+
+# main.py reads these at import time
+os.environ["DATABASE_PATH"] = BENCH_DB
+os.environ.setdefault("OPENAI_API_KEY", "bench-not-used")
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)
+
+import main  # noqa: E402
+
+EMAIL = "bench@example.com"
+
+def seed():
+    """Create the schema and one user with a chat session"""
+    main.init_database()
+    with main.db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR IGNORE INTO users (email, full_name, hashed_password) VALUES (?, ?, ?)",
+            (EMAIL, "Bench User", "x")
+        )
+        cursor.execute("SELECT id FROM users WHERE email = ?", (EMAIL,))
+        user_id = cursor.fetchone()[0]
+        cursor.execute("INSERT INTO chat_sessions (user_id, session_title) VALUES (?, ?)", (user_id, "bench"))
+
+    # The "before" run should see the default rollback journal, as the old code did
+    main.db_pool.close()
+    conn = sqlite3.connect(BENCH_DB)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    return user_id
+
+def request_connect_per_call(user_id: int):
+    """Old pattern: every helper opens and closes its own connection"""
+    conn = sqlite3.connect(BENCH_DB)
+    conn.execute("SELECT * FROM users WHERE email = ?", (EMAIL,)).fetchone()
+    conn.close()
+
+    conn = sqlite3.connect(BENCH_DB)
+    conn.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE email = ?", (EMAIL,))
+    conn.commit()
+    conn.close()
+
+    conn = sqlite3.connect(BENCH_DB)
+    session_id = conn.execute(
+        "SELECT id FROM chat_sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT 1", (user_id,)
+    ).fetchone()[0]
+    conn.execute("UPDATE chat_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?", (session_id,))
+    conn.execute(
+        "INSERT INTO chat_messages (session_id, user_message, ai_response) VALUES (?, ?, ?)",
+        (session_id, "savol", "javob")
+    )
+    conn.commit()
+    conn.close()
+
+def request_pooled(user_id: int):
+    """Same statements through the pooled, tuned connections"""
+    with main.db_connection() as conn:
+        conn.execute("SELECT * FROM users WHERE email = ?", (EMAIL,)).fetchone()
+
+    with main.db_connection() as conn:
+        conn.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE email = ?", (EMAIL,))
+
+    with main.db_connection() as conn:
+        session_id = conn.execute(
+            "SELECT id FROM chat_sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT 1", (user_id,)
+        ).fetchone()[0]
+        conn.execute("UPDATE chat_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?", (session_id,))
+        conn.execute(
+            "INSERT INTO chat_messages (session_id, user_message, ai_response) VALUES (?, ?, ?)",
+            (session_id, "savol", "javob")
+        )
+
+def measure(label: str, fn, user_id: int, requests: int) -> float:
+    """Run fn for the given number of requests and print the per-request cost"""
+    for _ in range(min(50, requests)):  # warm up page cache / pool
+        fn(user_id)
+    started = time.perf_counter()
+    for _ in range(requests):
+        fn(user_id)
+    per_request_us = (time.perf_counter() - started) / requests * 1e6
+    print(f"{label:<22} {per_request_us:10.1f} us/request")
+    return per_request_us
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="simulated chat requests per variant")
+    args = parser.parse_args()
+
+    user_id = seed()
+    print(f"Database: {BENCH_DB}")
+    print(f"Simulated authenticated chat requests: {args.requests}\n")
+
+    before = measure("connect-per-call", request_connect_per_call, user_id, args.requests)
+    after = measure("pooled (WAL, NORMAL)", request_pooled, user_id, args.requests)
+    print(f"\nSpeed-up: {before / after:.1f}x")
+    main.db_pool.close()
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: time from process spawn until /health answers.
+
+Starts `uvicorn main:app` --runs times against a throwaway database (migrated
+by a first, unreported start unless --fresh-db is given, which makes every
+run apply the full migration chain) and reports min/median/max time to the
+first healthy response. Exits with status 1 when the median exceeds
+--budget-ms, so it can gate deploys on scale-to-zero platforms.
+
+Usage: python bench/cold_start.py [--runs 5] [--budget-ms 1000] [--fresh-db] [--port 9300]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def start_once(port: int, db_path: str, timeout: float) -> float:
+    """Seconds from spawn to the first 200 from /health"""
+    env = {
+        **os.environ,
+        "DATABASE_PATH": db_path,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "cold-start-not-used"),
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                sys.exit(f"server exited with {process.returncode}:\n{process.stderr.read()[-2000:]}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.01)
+        sys.exit(f"server not healthy after {timeout:.0f}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000, help="fail when the median start exceeds this")
+    parser.add_argument("--fresh-db", action="store_true", help="migrate an empty database on every run")
+    parser.add_argument("--port", type=int, default=9300)
+    parser.add_argument("--timeout", type=float, default=60, help="give up on a single start after this many seconds")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="aspiro-cold-")
+    db_path = os.path.join(workdir, "cold.db")
+    if not args.fresh_db:
+        # Typical restart: schema already current, static bundle already built
+        start_once(args.port, db_path, args.timeout)
+
+    timings = []
+    for run in range(args.runs):
+        if args.fresh_db:
+            db_path = os.path.join(workdir, f"cold-{run}.db")
+        seconds = start_once(args.port, db_path, args.timeout)
+        timings.append(seconds * 1000)
+        print(f"  run {run + 1}: {seconds * 1000:7.0f} ms")
+
+    median = statistics.median(timings)
+    print(f"\ncold start to healthy: min {min(timings):.0f} ms, median {median:.0f} ms, max {max(timings):.0f} ms "
+          f"(budget {args.budget_ms:.0f} ms)")
+    if median > args.budget_ms:
+        print("FAIL: cold start is over budget")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat-completions API, for offline load tests.
+
+Answers POST /v1/chat/completions (plain and streaming, including the final
+usage chunk requested with stream_options.include_usage) after a configurable
+time-to-first-token, then produces tokens at a configurable rate. A share of
+requests can be failed with 429/500/503, left hanging to exercise timeouts or
+slowed down to create a latency tail. POST /settings changes any of these while
+the server runs (e.g. to start and end an outage).
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1.
+
+Usage: python bench/fake_openai.py [--port 9100] [--latency-ms 300] [--tokens-per-second 80]
+                                   [--response-tokens 120] [--error-rate 0.0] [--hang-rate 0.0]
+                                   [--slow-rate 0.0] [--slow-ms 3000]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+
+# Replaced from the command line (or by tests importing this module)
+settings = {
+    "latency_ms": 300.0,
+    "jitter_ms": 50.0,
+    "tokens_per_second": 80.0,
+    "response_tokens": 120,
+    "error_rate": 0.0,
+    "error_statuses": [429, 500, 503],
+    "hang_rate": 0.0,
+    "slow_rate": 0.0,
+    "slow_ms": 3000.0,
+}
+stats = {"requests": 0, "streams": 0, "errors_injected": 0, "hangs_injected": 0, "slow_injected": 0,
+         "prompt_tokens": 0, "completion_tokens": 0}
+
+WORDS = ("salom bu javob o'quvchi uchun tayyorlangan namuna matn bo'lib har bir so'z bitta token "
+         "sifatida hisoblanadi va yuklama sinovida ishlatiladi").split()
+
+def count_tokens(messages: list) -> int:
+    return sum(len(str(message.get("content", ""))) for message in messages) // 4 + 1
+
+def answer_words(messages: list, max_tokens: int) -> list:
+    """Deterministic per prompt, so response caches see realistic repeat answers"""
+    seed = hashlib.sha256(json.dumps(messages, sort_keys=True).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    return [rng.choice(WORDS) for _ in range(min(settings["response_tokens"], max_tokens))]
+
+async def first_token_delay(slow: bool = False):
+    delay = settings["latency_ms"] + random.uniform(-settings["jitter_ms"], settings["jitter_ms"])
+    if slow:
+        delay += settings["slow_ms"]
+    await asyncio.sleep(max(delay, 0) / 1000)
+
+def completion_id() -> str:
+    return f"chatcmpl-fake{random.getrandbits(48):012x}"
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-4o-mini")
+
+    if random.random() < settings["hang_rate"]:
+        stats["hangs_injected"] += 1
+        await asyncio.sleep(3600)
+    if random.random() < settings["error_rate"]:
+        stats["errors_injected"] += 1
+        status = random.choice(settings["error_statuses"])
+        await first_token_delay()
+        return JSONResponse(
+            status_code=status,
+            content={"error": {"message": f"Injected {status}", "type": "fake_error", "code": None}},
+            headers={"Retry-After": "1"} if status == 429 else None
+        )
+
+    slow = random.random() < settings["slow_rate"]
+    if slow:
+        stats["slow_injected"] += 1
+    words = answer_words(messages, int(body.get("max_tokens") or 1024))
+    prompt_tokens = count_tokens(messages)
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words), "total_tokens": prompt_tokens + len(words)}
+    stats["prompt_tokens"] += prompt_tokens
+    stats["completion_tokens"] += len(words)
+    created = int(time.time())
+    token_interval = 1 / settings["tokens_per_second"] if settings["tokens_per_second"] > 0 else 0
+
+    if not body.get("stream"):
+        await first_token_delay(slow)
+        await asyncio.sleep(token_interval * len(words))
+        return {
+            "id": completion_id(),
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    stats["streams"] += 1
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+    chunk_id = completion_id()
+
+    def chunk(delta: dict, finish_reason=None, chunk_usage=None, choices=True) -> str:
+        data = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if choices else [],
+        }
+        if chunk_usage is not None:
+            data["usage"] = chunk_usage
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def events():
+        await first_token_delay(slow)
+        yield chunk({"role": "assistant", "content": ""})
+        for index, word in enumerate(words):
+            yield chunk({"content": word if index == 0 else " " + word})
+            await asyncio.sleep(token_interval)
+        yield chunk({}, finish_reason="stop")
+        if include_usage:
+            yield chunk({}, chunk_usage=usage, choices=False)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "settings": settings}
+
+@app.post("/settings")
+async def update_settings(request: Request):
+    """Change fault injection on the fly, e.g. {"error_rate": 1.0} to start an outage"""
+    changes = await request.json()
+    unknown = sorted(set(changes) - set(settings))
+    if unknown:
+        return JSONResponse(status_code=400, content={"error": f"unknown settings: {', '.join(unknown)}"})
+    settings.update(changes)
+    return settings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=settings["latency_ms"], help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=settings["jitter_ms"])
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"],
+                        help="generation speed after the first token (0 = instant)")
+    parser.add_argument("--response-tokens", type=int, default=settings["response_tokens"],
+                        help="answer length, capped by the request's max_tokens")
+    parser.add_argument("--error-rate", type=float, default=settings["error_rate"],
+                        help="share of requests answered with an injected error")
+    parser.add_argument("--error-statuses", default="429,500,503", help="statuses to pick injected errors from")
+    parser.add_argument("--hang-rate", type=float, default=settings["hang_rate"],
+                        help="share of requests that never answer")
+    parser.add_argument("--slow-rate", type=float, default=settings["slow_rate"],
+                        help="share of requests delayed by --slow-ms before the first token")
+    parser.add_argument("--slow-ms", type=float, default=settings["slow_ms"])
+    args = parser.parse_args()
+
+    settings.update(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_statuses.split(",")],
+        hang_rate=args.hang_rate,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
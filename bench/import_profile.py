@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Import-time profile of main.py (python -X importtime), summarised.
+
+Runs `import main` in fresh interpreters, keeps the fastest run and prints the
+total, main's direct imports by cumulative time and the packages with the most
+self time. With --check it exits non-zero if a dependency that main.py loads
+lazily (OpenAI SDK, httpx, jose, passlib, google-auth, uvicorn) shows up at
+import time again.
+
+Usage: python bench/import_profile.py [--runs 5] [--top 15] [--check]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Imported on first use (or by the post-startup warm-up), never by `import main`
+LAZY_MODULES = ["openai", "httpx", "httpcore", "jose", "passlib", "google.auth", "uvicorn"]
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+def profile_once() -> list:
+    """[(module, depth, self_us, cumulative_us)] in the order the interpreter reports them"""
+    env = {
+        **os.environ,
+        "DATABASE_PATH": os.path.join(tempfile.mkdtemp(prefix="aspiro-import-"), "profile.db"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "profile-not-used"),
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"import main failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, len(indent) // 2, int(self_us), int(cumulative_us)))
+    return rows
+
+def main_entry(rows: list) -> tuple:
+    for module, depth, self_us, cumulative_us in rows:
+        if module == "main":
+            return depth, cumulative_us
+    sys.exit("main did not appear in the import profile")
+
+def direct_imports(rows: list) -> list:
+    """Modules main.py imported itself, with their cumulative cost
+
+    importtime lists children before their parent, so main's imports are the rows one level
+    deeper between the previous top-level entry and main itself.
+    """
+    depth_of_main, _ = main_entry(rows)
+    children = []
+    for module, depth, _, cumulative_us in rows:
+        if depth == depth_of_main:
+            if module == "main":
+                return children
+            children = []
+        elif depth == depth_of_main + 1:
+            children.append((module, cumulative_us))
+    return children
+
+def self_time_by_package(rows: list) -> dict:
+    totals = defaultdict(int)
+    for module, _, self_us, _ in rows:
+        totals[module.split(".")[0]] += self_us
+    return totals
+
+def loaded_lazy_modules(rows: list) -> list:
+    loaded = {module for module, *_ in rows}
+    return [name for name in LAZY_MODULES if any(module == name or module.startswith(name + ".") for module in loaded)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to try; the fastest is reported")
+    parser.add_argument("--top", type=int, default=15, help="rows per table")
+    parser.add_argument("--check", action="store_true", help="fail if a lazily imported dependency is loaded eagerly")
+    args = parser.parse_args()
+
+    runs = [profile_once() for _ in range(max(args.runs, 1))]
+    rows = min(runs, key=lambda run: main_entry(run)[1])
+    _, total_us = main_entry(rows)
+
+    print(f"import main: {total_us / 1000:.1f} ms (best of {len(runs)}), {len(rows)} modules\n")
+    print("Direct imports of main.py (cumulative):")
+    for module, cumulative_us in sorted(direct_imports(rows), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative_us / 1000:>8.1f} ms  {module}")
+    print("\nPackages by self time:")
+    for package, self_us in sorted(self_time_by_package(rows).items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {self_us / 1000:>8.1f} ms  {package}")
+
+    eager = loaded_lazy_modules(rows)
+    if eager:
+        print(f"\nLoaded at import time but meant to be lazy: {', '.join(eager)}")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("\nLazy dependencies stayed unloaded: " + ", ".join(LAZY_MODULES))
+
+if __name__ == "__main__":
+    main()
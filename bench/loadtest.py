@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Offline load test: how many concurrent students one main.py instance can serve.
+
+By default starts bench/fake_openai.py and `uvicorn main:app` against a
+throwaway database, registers --users accounts, then drives /chat,
+/pronunciation, /lesson and /chat-history from --concurrency workers for
+--duration seconds. Reports throughput, p50/p95/p99 latency and error rate
+per endpoint. Pass --base-url to target an instance you started yourself
+(it must already point at a fake or real upstream).
+
+Usage: python bench/loadtest.py [--concurrency 50] [--duration 30] [--users 20]
+                                [--mix chat=4,pronunciation=3,lesson=1,history=2]
+                                [--vocab 200] [--stream] [--latency-ms 300] [--error-rate 0]
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+LESSON_LEVELS = ["beginner", "intermediate", "advanced"]
+WORDS = ["apple", "beautiful", "education", "knowledge", "library", "teacher", "science", "history",
+         "mathematics", "language", "friendship", "weather", "journey", "village", "mountain", "river"]
+TOPICS = ["Present Simple", "Kasrlar", "Amir Temur", "Fotosintez", "Nyuton qonunlari", "Past Continuous",
+          "Geometriya asoslari", "Alisher Navoiy", "Kimyoviy reaksiyalar", "Modal verbs"]
+QUESTIONS = ["Kvadrat tenglamani qanday yechaman?", "Present Perfect qachon ishlatiladi?",
+             "Fotosintez nima?", "Amir Temur haqida qisqacha aytib bering", "Kasrlarni qo'shishni tushuntiring"]
+
+def chat_apologies() -> frozenset:
+    """Apology texts main.py returns as a 200 /chat answer when the upstream call failed"""
+    tree = ast.parse((ROOT / "main.py").read_text(encoding="utf-8"))
+    texts = set()
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+        names = [target.id for target in node.targets if isinstance(target, ast.Name)]
+        if any(name == "CHAT_ERROR_MESSAGES" or (name.startswith("UPSTREAM_") and name.endswith("_MESSAGE"))
+               for name in names):
+            value = ast.literal_eval(node.value)
+            texts.update(value if isinstance(value, list) else [value])
+    return frozenset(texts)
+
+CHAT_APOLOGIES = chat_apologies()
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - {"chat", "pronunciation", "lesson", "history"}
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+def vocabulary_item(pool: list, vocab: int, rng: random.Random) -> str:
+    """Pick one of `vocab` distinct prompts; smaller vocab means more cache hits"""
+    index = rng.randrange(vocab)
+    base = pool[index % len(pool)]
+    return base if index < len(pool) else f"{base} {index // len(pool)}"
+
+class Spawned:
+    """Fake upstream and app processes started for the run"""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes = []
+        self.workdir = tempfile.mkdtemp(prefix="aspiro-loadtest-")
+
+    def start(self) -> str:
+        args = self.args
+        fake_cmd = [
+            sys.executable, str(ROOT / "bench" / "fake_openai.py"),
+            "--port", str(args.fake_port),
+            "--latency-ms", str(args.latency_ms),
+            "--tokens-per-second", str(args.tokens_per_second),
+            "--response-tokens", str(args.response_tokens),
+            "--error-rate", str(args.error_rate),
+        ]
+        self.processes.append(subprocess.Popen(fake_cmd, cwd=ROOT))
+
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "loadtest-not-used",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{args.fake_port}/v1",
+            "DATABASE_PATH": os.path.join(self.workdir, "loadtest.db"),
+            # Only account setup hashes passwords; keep it quick
+            "BCRYPT_ROUNDS": "4",
+            # Measure capacity, not the per-plan quotas
+            "FREE_REQUESTS_PER_MINUTE": "1000000",
+            "FREE_REQUESTS_PER_DAY": "1000000000",
+            "FREE_TOKENS_PER_MINUTE": "1000000000",
+            "FREE_TOKENS_PER_DAY": "1000000000",
+        }
+        app_cmd = [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(args.app_port), "--workers", str(args.workers), "--log-level", "warning",
+        ]
+        self.processes.append(subprocess.Popen(app_cmd, cwd=ROOT, env=env))
+        return f"http://127.0.0.1:{args.app_port}"
+
+    def fake_stats(self) -> dict:
+        try:
+            return httpx.get(f"http://127.0.0.1:{self.args.fake_port}/stats", timeout=5).json()
+        except httpx.HTTPError:
+            return {}
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+async def wait_until_healthy(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("App did not become healthy")
+
+async def create_users(client: httpx.AsyncClient, count: int) -> list:
+    """Register (or log in) the load-test accounts; returns bearer tokens"""
+    run_id = f"{int(time.time())}{random.randrange(1000):03d}"
+
+    async def one(index: int) -> str:
+        credentials = {"email": f"load{run_id}-{index}@example.com", "password": "loadtest1"}
+        response = await client.post("/register", json={**credentials, "full_name": f"Load User {index}"})
+        if response.status_code != 200:
+            response = await client.post("/login", json=credentials)
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    return await asyncio.gather(*(one(index) for index in range(count)))
+
+async def run_load(client: httpx.AsyncClient, tokens: list, args) -> dict:
+    weights = parse_mix(args.mix)
+    endpoints = list(weights)
+    results = {endpoint: {"latencies": [], "errors": 0, "statuses": {}} for endpoint in endpoints}
+    deadline = time.monotonic() + args.duration
+
+    def outcome(response: httpx.Response):
+        """Status code, or "<code>+error" when the endpoint reports a failure inside a 2xx body
+        (an "error" field, or /chat answering with one of main.py's apology texts)"""
+        if response.status_code < 400:
+            try:
+                body = response.json()
+            except ValueError:
+                return response.status_code
+            if isinstance(body, dict) and ("error" in body or body.get("response") in CHAT_APOLOGIES):
+                return f"{response.status_code}+error"
+        return response.status_code
+
+    async def request(endpoint: str, headers: dict, rng: random.Random):
+        if endpoint == "chat":
+            body = {"message": vocabulary_item(QUESTIONS, args.vocab, rng)}
+            if args.stream:
+                async with client.stream("POST", "/chat/stream", json=body, headers=headers) as response:
+                    failed = False
+                    async for line in response.aiter_lines():
+                        failed = failed or line == "event: error"
+                    return f"{response.status_code}+error" if failed else response.status_code
+            return outcome(await client.post("/chat", json=body, headers=headers))
+        if endpoint == "pronunciation":
+            body = {"word": vocabulary_item(WORDS, args.vocab, rng)}
+            return outcome(await client.post("/pronunciation", json=body, headers=headers))
+        if endpoint == "lesson":
+            body = {"topic": vocabulary_item(TOPICS, args.vocab, rng), "level": rng.choice(LESSON_LEVELS)}
+            return outcome(await client.post("/lesson", json=body, headers=headers))
+        return outcome(await client.get("/chat-history", headers=headers))
+
+    async def worker(worker_id: int):
+        rng = random.Random(worker_id)
+        while time.monotonic() < deadline:
+            endpoint = rng.choices(endpoints, weights=[weights[name] for name in endpoints])[0]
+            headers = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+            started = time.perf_counter()
+            try:
+                status = await request(endpoint, headers, rng)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            result = results[endpoint]
+            result["latencies"].append(elapsed_ms)
+            result["statuses"][str(status)] = result["statuses"].get(str(status), 0) + 1
+            if not (isinstance(status, int) and status < 400):
+                result["errors"] += 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(index) for index in range(args.concurrency)))
+    elapsed = time.monotonic() - started
+    return summarize(results, elapsed)
+
+def summarize(results: dict, elapsed: float) -> dict:
+    report = {"elapsed_seconds": round(elapsed, 2), "endpoints": {}}
+    all_latencies = []
+    all_errors = 0
+    for endpoint, result in results.items():
+        latencies = sorted(result["latencies"])
+        all_latencies.extend(latencies)
+        all_errors += result["errors"]
+        report["endpoints"][endpoint] = endpoint_summary(latencies, result["errors"], elapsed, result["statuses"])
+    report["total"] = endpoint_summary(sorted(all_latencies), all_errors, elapsed, {})
+    return report
+
+def endpoint_summary(latencies: list, errors: int, elapsed: float, statuses: dict) -> dict:
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':<15} {'requests':>9} {'rps':>8} {'errors':>7} {'err%':>6} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for name, row in rows:
+        print(f"{name:<15} {row['requests']:>9} {row['rps']:>8.1f} {row['errors']:>7} {row['error_rate'] * 100:>5.1f}% "
+              f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    for name, row in report["endpoints"].items():
+        failures = {status: n for status, n in row["statuses"].items() if not (status.isdigit() and int(status) < 400)}
+        if failures:
+            print(f"  {name} failures: {failures}")
+
+async def main_async(args):
+    spawned = None
+    base_url = args.base_url
+    if not base_url:
+        spawned = Spawned(args)
+        base_url = spawned.start()
+
+    limits = httpx.Limits(max_connections=args.concurrency + 10, max_keepalive_connections=args.concurrency + 10)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await wait_until_healthy(client)
+            tokens = await create_users(client, args.users)
+            print(f"Target: {base_url}  users: {len(tokens)}  concurrency: {args.concurrency}  "
+                  f"duration: {args.duration}s  mix: {args.mix}  vocab: {args.vocab}"
+                  f"{'  (streaming chat)' if args.stream else ''}")
+
+            report = await run_load(client, tokens, args)
+            report["config"] = {key: value for key, value in vars(args).items()}
+            try:
+                report["cache_stats"] = (await client.get("/cache-stats")).json()
+            except (httpx.HTTPError, ValueError):
+                pass
+        if spawned:
+            report["upstream"] = spawned.fake_stats()
+    finally:
+        if spawned:
+            spawned.stop()
+
+    print_report(report)
+    if "upstream" in report:
+        print(f"\nUpstream completions: {report['upstream'].get('requests', 0)} "
+              f"(injected errors: {report['upstream'].get('errors_injected', 0)})")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.json}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="target a running instance instead of starting one")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent simulated students")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--users", type=int, default=20, help="accounts to register and rotate through")
+    parser.add_argument("--mix", default="chat=4,pronunciation=3,lesson=1,history=2",
+                        help="endpoint weights")
+    parser.add_argument("--vocab", type=int, default=200,
+                        help="distinct words/topics/questions (lower = more cache hits)")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream for chat requests")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request client timeout")
+    parser.add_argument("--json", help="also write the report to this file")
+    spawn = parser.add_argument_group("spawned app and fake upstream")
+    spawn.add_argument("--app-port", type=int, default=9000)
+    spawn.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    spawn.add_argument("--fake-port", type=int, default=9100)
+    spawn.add_argument("--latency-ms", type=float, default=300, help="upstream time to first token")
+    spawn.add_argument("--tokens-per-second", type=float, default=80)
+    spawn.add_argument("--response-tokens", type=int, default=120)
+    spawn.add_argument("--error-rate", type=float, default=0.0, help="share of upstream calls that fail")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Fault-injection checks for the LLM resilience layer (deadlines, retries,
+circuit breaker, hedging), run against bench/fake_openai.py.
+
+Each scenario starts `uvicorn main:app` with its own settings, switches the
+fake upstream's faults through POST /settings and drives /pronunciation with
+unique words (so the response cache never answers):
+
+  transient  30% of upstream calls fail with 429/500/503: success rate with
+             retries off vs on
+  hang       the upstream never answers: requests must end near the deadline
+  outage     every call fails: the circuit opens and later requests fail fast,
+             then closes again once the upstream recovers
+  hedging    10% of calls are 2s slower: p95/p99 with hedging off vs on, and
+             the extra upstream calls it costs
+
+Exits with status 1 if any check fails.
+
+Usage: python bench/resilience.py [--scenarios transient,hang,outage,hedging] [--requests 60]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from loadtest import create_users, percentile, wait_until_healthy
+
+ROOT = Path(__file__).resolve().parent.parent
+SCENARIOS = ["transient", "hang", "outage", "hedging"]
+
+FAKE_DEFAULTS = {
+    "latency_ms": 200.0,
+    "jitter_ms": 20.0,
+    "tokens_per_second": 0.0,
+    "response_tokens": 30,
+    "error_rate": 0.0,
+    "error_statuses": [429, 500, 503],
+    "hang_rate": 0.0,
+    "slow_rate": 0.0,
+    "slow_ms": 2000.0,
+}
+
+class Stack:
+    """One fake upstream shared by the scenarios, one app process per configuration"""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="aspiro-resilience-")
+        self.fake = None
+        self.fake_url = f"http://127.0.0.1:{args.fake_port}"
+        self.apps = 0
+
+    def start_fake(self):
+        self.fake = subprocess.Popen(
+            [sys.executable, str(ROOT / "bench" / "fake_openai.py"), "--port", str(self.args.fake_port)], cwd=ROOT
+        )
+
+    async def fake_settings(self, **changes):
+        async with httpx.AsyncClient(timeout=5) as client:
+            for _ in range(100):
+                try:
+                    response = await client.post(f"{self.fake_url}/settings", json={**FAKE_DEFAULTS, **changes})
+                    response.raise_for_status()
+                    return
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        raise SystemExit("Fake upstream did not start")
+
+    async def fake_requests(self) -> int:
+        async with httpx.AsyncClient(timeout=5) as client:
+            return (await client.get(f"{self.fake_url}/stats")).json()["requests"]
+
+    def start_app(self, **env_overrides) -> subprocess.Popen:
+        self.apps += 1
+        env = {
+            **os.environ,
+            "OPENAI_API_KEY": "resilience-not-used",
+            "OPENAI_BASE_URL": f"{self.fake_url}/v1",
+            "DATABASE_PATH": os.path.join(self.workdir, f"app{self.apps}.db"),
+            "BCRYPT_ROUNDS": "4",
+            "FREE_REQUESTS_PER_MINUTE": "1000000",
+            "FREE_REQUESTS_PER_DAY": "1000000000",
+            "FREE_TOKENS_PER_MINUTE": "1000000000",
+            "FREE_TOKENS_PER_DAY": "1000000000",
+            **{key: str(value) for key, value in env_overrides.items()},
+        }
+        return subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.args.app_port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    @staticmethod
+    def stop(process: subprocess.Popen):
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def close(self):
+        if self.fake:
+            self.stop(self.fake)
+
+class App:
+    """Async context: a started app with one registered user"""
+
+    def __init__(self, stack: Stack, **env_overrides):
+        self.stack = stack
+        self.env_overrides = env_overrides
+        self.words = 0
+
+    async def __aenter__(self):
+        self.process = self.stack.start_app(**self.env_overrides)
+        self.client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.stack.args.app_port}", timeout=120)
+        await wait_until_healthy(self.client)
+        self.token = (await create_users(self.client, 1))[0]
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+        self.stack.stop(self.process)
+
+    async def pronounce(self) -> tuple:
+        """(ok, seconds) for one uncached /pronunciation request"""
+        self.words += 1
+        started = time.perf_counter()
+        response = await self.client.post(
+            "/pronunciation", json={"word": f"resilience{self.words}-{time.time_ns()}"},
+            headers={"Authorization": f"Bearer {self.token}"}
+        )
+        ok = response.status_code == 200 and "error" not in response.json()
+        return ok, time.perf_counter() - started
+
+    async def burst(self, count: int, concurrency: int) -> list:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with slots:
+                return await self.pronounce()
+
+        return await asyncio.gather(*(one() for _ in range(count)))
+
+    async def upstream_state(self) -> dict:
+        return (await self.client.get("/health")).json()["llm_upstream"]
+
+def latency_summary(results: list) -> str:
+    latencies = sorted(seconds for _, seconds in results)
+    return (f"p50 {percentile(latencies, 50) * 1000:6.0f} ms  p95 {percentile(latencies, 95) * 1000:6.0f} ms  "
+            f"p99 {percentile(latencies, 99) * 1000:6.0f} ms")
+
+class Checks:
+    def __init__(self):
+        self.failed = []
+
+    def expect(self, condition: bool, description: str):
+        print(f"  [{'ok' if condition else 'FAIL'}] {description}")
+        if not condition:
+            self.failed.append(description)
+
+async def transient(stack: Stack, checks: Checks, args):
+    await stack.fake_settings(error_rate=0.3)
+    rates = {}
+    for label, retries in (("retries off", 0), ("retries on", 2)):
+        async with App(stack, LLM_MAX_RETRIES=retries, LLM_RETRY_BASE_DELAY=0.1) as app:
+            results = await app.burst(args.requests, 10)
+        rates[label] = sum(ok for ok, _ in results) / len(results)
+        print(f"  {label:<12} success {rates[label]:6.1%}  {latency_summary(results)}")
+    checks.expect(rates["retries on"] >= 0.9, "retries lift the success rate to >= 90% at 30% upstream errors")
+    checks.expect(rates["retries on"] > rates["retries off"], "retries beat no retries")
+
+async def hang(stack: Stack, checks: Checks, args):
+    deadline = 2.0
+    await stack.fake_settings(hang_rate=1.0)
+    async with App(stack, LLM_DEADLINES=f"/pronunciation={deadline}") as app:
+        results = await app.burst(5, 5)
+    slowest = max(seconds for _, seconds in results)
+    print(f"  deadline {deadline:.1f}s  failed {sum(not ok for ok, _ in results)}/5  slowest {slowest:.2f}s")
+    checks.expect(not any(ok for ok, _ in results), "hung upstream calls fail instead of succeeding")
+    checks.expect(slowest < deadline + 1.0, "requests end within the deadline (+1s)")
+
+async def outage(stack: Stack, checks: Checks, args):
+    cooldown = 2.0
+    await stack.fake_settings(error_rate=1.0, error_statuses=[503])
+    async with App(stack, LLM_BREAKER_FAILURES=5, LLM_BREAKER_COOLDOWN=cooldown, LLM_MAX_RETRIES=0) as app:
+        before = await stack.fake_requests()
+        results = [await app.pronounce() for _ in range(20)]
+        upstream_calls = await stack.fake_requests() - before
+        state = await app.upstream_state()
+        fast = [seconds for ok, seconds in results[5:] if not ok]
+        print(f"  outage: upstream calls {upstream_calls} for 20 requests, circuit {state['state']}, "
+              f"fail-fast p50 {percentile(sorted(fast), 50) * 1000:.0f} ms")
+        checks.expect(state["state"] == "open", "circuit opens after consecutive failures")
+        checks.expect(upstream_calls <= 6, "an open circuit stops sending calls upstream")
+        checks.expect(bool(fast) and percentile(sorted(fast), 50) < 0.1, "requests fail fast (<100 ms) while open")
+
+        await stack.fake_settings()
+        await asyncio.sleep(cooldown + 0.5)
+        recovered = [await app.pronounce() for _ in range(3)]
+        state = await app.upstream_state()
+        print(f"  recovery: {sum(ok for ok, _ in recovered)}/3 ok, circuit {state['state']}")
+        checks.expect(all(ok for ok, _ in recovered) and state["state"] == "closed",
+                      "circuit closes again after the cooldown once the upstream recovers")
+
+async def hedging(stack: Stack, checks: Checks, args):
+    await stack.fake_settings(slow_rate=0.1, slow_ms=2000)
+    tails = {}
+    for label, hedge_after in (("hedging off", 0), ("hedging on", 600)):
+        async with App(stack, LLM_HEDGE_AFTER_MS=hedge_after) as app:
+            before = await stack.fake_requests()
+            results = await app.burst(args.requests, 5)
+            extra = await stack.fake_requests() - before - len(results)
+        tails[label] = percentile(sorted(seconds for _, seconds in results), 99)
+        print(f"  {label:<12} {latency_summary(results)}  extra upstream calls {extra}")
+    checks.expect(tails["hedging on"] < tails["hedging off"], "hedging lowers p99 latency")
+
+async def main_async(args):
+    stack = Stack(args)
+    stack.start_fake()
+    checks = Checks()
+    try:
+        for name in args.scenarios.split(","):
+            print(f"\n{name}")
+            await globals()[name](stack, checks, args)
+    finally:
+        stack.close()
+
+    print(f"\n{'All checks passed' if not checks.failed else f'{len(checks.failed)} check(s) failed'}")
+    if checks.failed:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=60, help="requests per burst")
+    parser.add_argument("--app-port", type=int, default=9000)
+    parser.add_argument("--fake-port", type=int, default=9100)
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios.split(",") if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Static asset pipeline: minify, fingerprint and precompress the JS/CSS bundles
+and rewrite the references to them in the HTML pages.
+
+Outputs go to static/dist/ together with manifest.json. main.py loads the
+manifest at startup (building it first if it is missing or the sources
+changed) and serves the hashed files from /assets/ with immutable caching.
+
+Usage: python build_assets.py
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip alone still works everywhere
+    brotli = None
+
+ASSETS = [
+    "static/script.js",
+    "static/style.css",
+    "static/landing.css",
+    "static/landing.js",
+    "static/pricing.js",
+]
+
+PAGES = [
+    "index.html",
+    "static/index.html",
+    "static/login.html",
+    "static/register.html",
+    "static/pricing.html",
+    "test_ui.html",
+]
+
+DIST_DIR = "static/dist"
+MANIFEST_NAME = "manifest.json"
+ASSET_URL_PREFIX = "/assets/"
+
+# Tokens after which a "/" starts a regular expression rather than a division
+JS_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+JS_REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw",
+                     "instanceof", "yield", "await"}
+
+def is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_$\\" or ord(char) > 127
+
+def skip_quoted(source: str, i: int) -> int:
+    """Index just past the string literal starting at i"""
+    quote = source[i]
+    i += 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == "\\" else 1
+    return i + 1
+
+def skip_template(source: str, i: int) -> int:
+    """Index just past the template literal starting at i, including nested ${...} expressions"""
+    i += 1
+    while i < len(source):
+        char = source[i]
+        if char == "\\":
+            i += 2
+        elif char == "`":
+            return i + 1
+        elif source.startswith("${", i):
+            i += 2
+            depth = 1
+            while i < len(source) and depth:
+                char = source[i]
+                if char in "'\"":
+                    i = skip_quoted(source, i)
+                    continue
+                if char == "`":
+                    i = skip_template(source, i)
+                    continue
+                depth += {"{": 1, "}": -1}.get(char, 0)
+                i += 1
+        else:
+            i += 1
+    return i
+
+def skip_regex(source: str, i: int) -> int:
+    """Index just past the regular expression literal (and flags) starting at i"""
+    i += 1
+    in_class = False
+    while i < len(source):
+        char = source[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "[":
+            in_class = True
+        elif char == "]":
+            in_class = False
+        elif char == "/" and not in_class:
+            i += 1
+            break
+        i += 1
+    while i < len(source) and source[i].isalpha():
+        i += 1
+    return i
+
+def minify_js(source: str) -> str:
+    """Conservative JS minifier: drops comments, indentation and blank lines, squeezes spaces.
+
+    Line breaks are kept (collapsed to one) so automatic semicolon insertion behaves
+    exactly as in the original source; literals are copied verbatim.
+    """
+    out = []
+    last_word = ""
+    pending = ""  # whitespace seen since the last token: "", " " or "\n"
+    i = 0
+    n = len(source)
+
+    def emit(token: str):
+        nonlocal pending
+        if out and pending:
+            prev = out[-1][-1]
+            first = token[0]
+            if pending == "\n":
+                out.append("\n")
+            elif is_word_char(prev) and is_word_char(first):
+                out.append(" ")
+            elif prev in "+-" and first in "+-" or prev == "/" and first in "/*":
+                out.append(" ")
+        pending = ""
+        out.append(token)
+
+    while i < n:
+        char = source[i]
+        if char in " \t\r\n\f\v":
+            j = i
+            while j < n and source[j] in " \t\r\n\f\v":
+                j += 1
+            pending = "\n" if "\n" in source[i:j] or pending == "\n" else " "
+            i = j
+        elif source.startswith("//", i):
+            j = source.find("\n", i)
+            i = n if j == -1 else j
+            pending = pending or " "
+        elif source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            comment_end = n if j == -1 else j + 2
+            pending = "\n" if "\n" in source[i:comment_end] or pending == "\n" else (pending or " ")
+            i = comment_end
+        elif char in "'\"":
+            j = skip_quoted(source, i)
+            emit(source[i:j])
+            last_word = ""
+            i = j
+        elif char == "`":
+            j = skip_template(source, i)
+            emit(source[i:j])
+            last_word = ""
+            i = j
+        elif char == "/":
+            prev = out[-1][-1] if out else ""
+            if not prev or prev in JS_REGEX_PRECEDERS or last_word in JS_REGEX_KEYWORDS:
+                j = skip_regex(source, i)
+            else:
+                j = i + 1
+            emit(source[i:j])
+            last_word = ""
+            i = j
+        elif is_word_char(char):
+            j = i
+            while j < n and is_word_char(source[j]):
+                j += 2 if source[j] == "\\" else 1
+            last_word = source[i:j]
+            emit(last_word)
+            i = j
+        else:
+            emit(char)
+            last_word = ""
+            i += 1
+
+    return "".join(out).strip() + "\n"
+
+def minify_css(source: str) -> str:
+    """Conservative CSS minifier: drops comments and whitespace that cannot change meaning"""
+    out = []
+    i = 0
+    n = len(source)
+    pending = False
+
+    while i < n:
+        char = source[i]
+        if source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            i = n if j == -1 else j + 2
+            pending = True
+        elif char.isspace():
+            pending = True
+            i += 1
+        elif char in "'\"":
+            j = skip_quoted(source, i)
+            if pending and out and out[-1][-1] not in "{};,>:(":
+                out.append(" ")
+            pending = False
+            out.append(source[i:j])
+            i = j
+        else:
+            # Spaces before ":" are kept: "a :hover" and "a:hover" are different selectors
+            if pending and out and out[-1][-1] not in "{};,>:(" and char not in "{};,>)":
+                out.append(" ")
+            pending = False
+            if char == "}" and out and out[-1] == ";":
+                out.pop()
+            out.append(char)
+            i += 1
+
+    return "".join(out).strip() + "\n"
+
+def precompress(data: bytes) -> dict:
+    """Encoded variants of data, keyed by Content-Encoding"""
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    return variants
+
+def write_atomic(path: Path, data: bytes):
+    """Write via a temporary file so concurrent workers never serve a half-written file"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+def write_with_variants(dist: Path, name: str, data: bytes) -> list:
+    """Write a file and its precompressed variants; returns the available encodings"""
+    write_atomic(dist / name, data)
+    variants = precompress(data)
+    for encoding, encoded in variants.items():
+        write_atomic(dist / f"{name}.{'gz' if encoding == 'gzip' else encoding}", encoded)
+    return sorted(variants)
+
+def source_hashes(root: Path) -> dict:
+    return {
+        path: hashlib.sha256((root / path).read_bytes()).hexdigest()
+        for path in ASSETS + PAGES
+        if (root / path).exists()
+    }
+
+def build_assets(root: Path = Path(".")) -> dict:
+    """Build static/dist/ and return the manifest"""
+    dist = root / DIST_DIR
+    dist.mkdir(parents=True, exist_ok=True)
+    manifest = {"assets": {}, "pages": {}, "sources": source_hashes(root)}
+    url_map = {}
+
+    for path in ASSETS:
+        if not (root / path).exists():
+            continue
+        source = (root / path).read_text(encoding="utf-8")
+        minified = minify_js(source) if path.endswith(".js") else minify_css(source)
+        data = minified.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        stem, suffix = os.path.splitext(os.path.basename(path))
+        name = f"{stem}.{digest[:12]}{suffix}"
+        encodings = write_with_variants(dist, name, data)
+        manifest["assets"][path] = {
+            "file": name,
+            "etag": digest[:32],
+            "encodings": encodings,
+            "size": len(source.encode("utf-8")),
+            "minified_size": len(data),
+        }
+        url_map[path] = ASSET_URL_PREFIX + name
+
+    # Pages reference assets as "/static/x.js" or "static/x.js"
+    reference = re.compile(r'(href|src)="/?(static/[\w.-]+\.(?:js|css))"')
+    for path in PAGES:
+        if not (root / path).exists():
+            continue
+        html = (root / path).read_text(encoding="utf-8")
+        html = reference.sub(lambda m: f'{m.group(1)}="{url_map.get(m.group(2), "/" + m.group(2))}"', html)
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{path.replace('/', '_')}"
+        encodings = write_with_variants(dist, name, data)
+        manifest["pages"][path] = {"file": name, "etag": digest[:32], "encodings": encodings}
+
+    write_atomic(dist / MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"))
+    return manifest
+
+def load_or_build(root: Path = Path(".")) -> dict:
+    """Load the manifest if it matches the current sources, otherwise rebuild"""
+    manifest_path = root / DIST_DIR / MANIFEST_NAME
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("sources") == source_hashes(root):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return build_assets(root)
+
+def main():
+    root = Path(__file__).resolve().parent
+    manifest = build_assets(root)
+    for path, entry in manifest["assets"].items():
+        sizes = ", ".join(
+            f"{encoding} {(root / DIST_DIR / (entry['file'] + ('.gz' if encoding == 'gzip' else '.br'))).stat().st_size:>7}"
+            for encoding in entry["encodings"]
+        )
+        print(f"{path:<22} {entry['size']:>7} -> {entry['minified_size']:>7} ({sizes})  {entry['file']}")
+    print(f"{len(manifest['pages'])} pages rewritten into {DIST_DIR}/")
+    if brotli is None:
+        print("brotli is not installed; only gzip variants were written", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
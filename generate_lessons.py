@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Lesson library generator: precomputes /lesson answers for every topic and
+level in the lesson catalog (lesson_catalog.json, or LESSON_CATALOG_PATH).
+
+Lessons that are missing come first, then stale ones (older than
+--max-age-days, or made with another model or prompt version). Each lesson
+is written to the database as soon as it is ready, so an interrupted run
+picks up where it stopped. The running app refreshes stale lessons on its
+own every LESSON_REFRESH_INTERVAL seconds; this script does the initial fill
+or a full regeneration.
+
+Usage: python generate_lessons.py [--concurrency 2] [--limit N] [--max-age-days 30] [--force] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import main
+
+async def run(args) -> int:
+    library = main.lesson_library
+    pairs = library.pending(max_age_days=args.max_age_days, force=args.force)
+    total = len(library.catalog)
+    if args.limit:
+        pairs = pairs[:args.limit]
+    print(f"Lesson catalog: {total} lessons, {len(pairs)} to generate")
+    if args.dry_run:
+        for topic, level in pairs:
+            print(f"  {level:<13} {topic}")
+        return 0
+    if not pairs:
+        return 0
+    if not main.OPENAI_API_KEY:
+        print("OPENAI_API_KEY is not set")
+        return 1
+
+    started = time.perf_counter()
+    done = 0
+
+    def progress(topic: str, level: str, error: Exception):
+        nonlocal done
+        done += 1
+        status = f"failed: {error}" if error else "ok"
+        print(f"  [{done}/{len(pairs)}] {level:<13} {topic} - {status}")
+
+    try:
+        counts = await library.generate(pairs, args.concurrency, on_result=progress)
+    finally:
+        if main._llm_client is not None:
+            await main._llm_client.close()
+
+    print(f"\n{counts['generated']} generated, {counts['failed']} failed in {time.perf_counter() - started:.0f}s")
+    if counts["failed"]:
+        print("Run the script again to retry the failed lessons")
+    return 1 if counts["failed"] else 0
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=main.LESSON_GENERATION_CONCURRENCY,
+                        help="upstream calls in flight at once")
+    parser.add_argument("--limit", type=int, default=0, help="generate at most this many lessons (0 = all pending)")
+    parser.add_argument("--max-age-days", type=float, default=main.LESSON_MAX_AGE_DAYS,
+                        help="regenerate lessons older than this")
+    parser.add_argument("--force", action="store_true", help="regenerate every catalog lesson")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be generated and exit")
+    args = parser.parse_args()
+
+    main.init_database()
+    try:
+        exit_code = asyncio.run(run(args))
+    finally:
+        main.db_pool.close()
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,48 +1,438 @@
-from fastapi import FastAPI, HTTPException, Form, File, UploadFile, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
-from openai import OpenAI
+import asyncio
 import os
 from dotenv import load_dotenv
-import uvicorn
 from typing import List, Optional
 import base64
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 import sqlite3
+import queue
+from contextlib import contextmanager
 from pathlib import Path
 import hashlib
-from google.auth.transport import requests as google_requests
-from google.oauth2 import id_token
 import json
+import random
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+import math
+import threading
+import tempfile
+import socket
+from multipart.multipart import MultipartParser, parse_options_header
+import build_assets
 
 # Load environment variables
 load_dotenv()
 
 app = FastAPI(title="Aspiro AI", description="English learning assistant for Uzbek students")
 
+# Metrics: Prometheus text exposition, kept per worker process. Every series carries a
+# worker="<pid>" label, so scrapes that land on different gunicorn workers stay separate series
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # If set, /metrics requires "Authorization: Bearer <token>"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+class Metric:
+    """A named metric with one series per label combination"""
+    kind = "untyped"
+    
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._series = {}
+        metrics_registry.append(self)
+    
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        worker = str(os.getpid())
+        for key, value in sorted(self._series.items()):
+            lines.extend(self._render_series({**dict(zip(self.labelnames, key)), "worker": worker}, value))
+        return lines
+    
+    def _render_series(self, labels: dict, value) -> List[str]:
+        return [f"{self.name}{format_labels(labels)} {value}"]
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    
+    def __init__(self, name: str, description: str, labelnames: tuple = (), callback=None):
+        super().__init__(name, description, labelnames)
+        self.callback = callback  # Read at scrape time instead of being updated
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+    
+    def render(self) -> List[str]:
+        if self.callback:
+            self._series = {(): self.callback()}
+        return super().render()
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = buckets
+    
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][index] += 1
+        series["sum"] += value
+        series["count"] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def _render_series(self, labels: dict, series: dict) -> List[str]:
+        lines = [
+            f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {count}"
+            for bound, count in zip(self.buckets, series["counts"])
+        ]
+        lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {series['count']}")
+        lines.append(f"{self.name}_sum{format_labels(labels)} {series['sum']}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {series['count']}")
+        return lines
+
+metrics_registry = []
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "Time to fully serve a request, streaming included", ("route", "method"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "Requests currently being served")
+auth_duration = Histogram("auth_duration_seconds", "Time spent in get_current_user")
+db_hold_duration = Histogram(
+    "db_connection_hold_seconds",
+    "Time a pooled SQLite connection is held, from checkout to release (caller work between queries included)"
+)
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Time SQLite spends running one statement (execute/executemany)", ("op",)
+)
+llm_duration = Histogram("llm_request_duration_seconds", "Upstream chat completion time", ("endpoint", "stream"))
+llm_first_token = Histogram("llm_time_to_first_token_seconds", "Upstream time to first streamed token", ("endpoint",))
+llm_requests_in_flight = Gauge("llm_requests_in_flight", "Upstream chat completions in progress")
+llm_tokens_total = Counter("llm_tokens_total", "Upstream tokens from response.usage (estimated if missing)", ("endpoint", "kind"))
+errors_total = Counter("errors_total", "Errors by exception type and where they were caught", ("type", "where"))
+llm_retries_total = Counter("llm_retries_total", "Upstream attempts retried after a transient failure", ("endpoint", "reason"))
+llm_hedges_total = Counter("llm_hedges_total", "Hedged upstream requests by which copy answered first", ("endpoint", "outcome"))
+chat_near_dup_total = Counter("chat_near_dup_total", "Near-duplicate chat cache lookups by outcome", ("outcome",))
+lesson_library_total = Counter("lesson_library_total", "Lesson requests by how they were served", ("outcome",))
+lesson_generation_total = Counter("lesson_generation_total", "Lesson library generations by outcome", ("outcome",))
+chat_near_dup_lookup = Histogram("chat_near_dup_lookup_seconds", "Time to look a question up in the near-duplicate index")
+
+# Scope of the request being served, so deeper layers can label metrics by route
+request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+
+def current_route() -> str:
+    """Route template of the current request ("background" outside one)"""
+    scope = request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", "other")
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, status counts and in-flight requests"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        response_status = {"code": 500}
+        
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                response_status["code"] = message["status"]
+            await send(message)
+        
+        request_scope.set(scope)
+        started = time.perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            errors_total.inc(type=type(e).__name__, where="request")
+            raise
+        finally:
+            http_requests_in_flight.dec()
+            # The router has filled in scope["route"] by now
+            route = current_route()
+            http_request_duration.observe(time.perf_counter() - started, route=route, method=scope["method"])
+            http_requests_total.inc(route=route, method=scope["method"], status=response_status["code"])
+
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "aspiro-ai-secret-key-2024-uzbekistan-education")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))  # Cost factor; hashes with another cost are upgraded on login
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 64))  # Jobs allowed to wait for a worker before 503
+
+_pwd_context = None
+
+def password_context():
+    """bcrypt CryptContext, built on first use so passlib stays out of the import path"""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=BCRYPT_ROUNDS,
+            bcrypt__min_rounds=BCRYPT_ROUNDS,
+            bcrypt__max_rounds=BCRYPT_ROUNDS
+        )
+    return _pwd_context
+
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+password_job_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
 
 # JWT Security
 security = HTTPBearer()
 
+# Authentication fast path (per worker; TTL bounds staleness across workers)
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", 300))  # Seconds a user record is trusted without a DB read
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+LAST_LOGIN_INTERVAL = int(os.getenv("LAST_LOGIN_INTERVAL", 300))  # Write last_login at most this often per user
+
 # Database setup
-DATABASE_URL = "users.db"
+DATABASE_URL = os.getenv("DATABASE_PATH", "users.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))  # Idle connections kept per worker
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))  # Wait this long for a lock instead of failing
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", 16384))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 128 * 1024 * 1024))
+DB_STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per pooled connection
+SKIP_DB_INIT = os.getenv("SKIP_DB_INIT") == "1"  # Set by start.py --production, which migrates before forking workers
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records each statement in db_query_duration_seconds"""
+    
+    def execute(self, sql, parameters=()):
+        with db_query_duration.time(op="execute"):
+            return super().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        with db_query_duration.time(op="executemany"):
+            return super().executemany(sql, seq_of_parameters)
 
-def init_database():
-    """Initialize SQLite database for users"""
-    conn = sqlite3.connect(DATABASE_URL)
-    cursor = conn.cursor()
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (and execute shortcut) are TimedCursors"""
+    
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+class SQLitePool:
+    """Reusable pool of tuned SQLite connections (WAL, busy timeout, statement cache)"""
+    
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            factory=TimedConnection
+        )
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers no longer block the writer
+        conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, one fsync per checkpoint
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
     
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success, rolls back on error"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        
+        started = time.perf_counter()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            db_hold_duration.observe(time.perf_counter() - started)
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+db_pool = SQLitePool(DATABASE_URL, DB_POOL_SIZE)
+
+def db_connection():
+    """Borrow a pooled database connection"""
+    return db_pool.connection()
+
+# Write-behind queue: request handlers enqueue writes, one writer applies them in batches
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", 200))  # Jobs per transaction
+WRITE_QUEUE_FLUSH_INTERVAL = float(os.getenv("WRITE_QUEUE_FLUSH_INTERVAL", 0.05))  # Seconds to wait for a batch to fill
+WRITE_QUEUE_MAX_SIZE = int(os.getenv("WRITE_QUEUE_MAX_SIZE", 10000))  # Beyond this, writes skip batching (one per transaction)
+
+class WriteBehindQueue:
+    """Single writer that applies queued DB writes in grouped transactions"""
+    
+    def __init__(self, max_batch: int, flush_interval: float, max_size: int):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._queue = None
+        self._task = None
+        # One thread = one writer, so queued writes never contend with each other
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.stats = {"enqueued": 0, "written": 0, "failed": 0, "batches": 0, "inline": 0, "overflow": 0}
+    
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.create_task(self._run())
+    
+    def submit(self, fn, *args):
+        """Queue fn(cursor, *args) to run in the next write transaction (inline only before start/after drain)"""
+        if self._task is None or self._task.done():
+            self._write_batch([(fn, args)])
+            self.stats["inline"] += 1
+            return
+        try:
+            self._queue.put_nowait((fn, args))
+            self.stats["enqueued"] += 1
+        except asyncio.QueueFull:
+            # Never write on the event loop while overloaded: hand the job straight to the writer thread,
+            # which keeps writes single-threaded (drain() waits for these too)
+            self._executor.submit(self._write_batch, [(fn, args)])
+            self.stats["overflow"] += 1
+    
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+    
+    def snapshot(self) -> dict:
+        return {**self.stats, "depth": self.depth()}
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            
+            # Flush when the batch is full or the flush interval has passed
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            
+            await loop.run_in_executor(self._executor, self._write_batch, batch)
+    
+    def _write_batch(self, batch: list):
+        try:
+            with db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN")
+                for fn, args in batch:
+                    # A failing job must not roll back the rest of the batch
+                    cursor.execute("SAVEPOINT job")
+                    try:
+                        fn(cursor, *args)
+                        self.stats["written"] += 1
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO job")
+                        self.stats["failed"] += 1
+                        print(f"Error in queued write {fn.__name__}: {e}")
+                    cursor.execute("RELEASE job")
+            self.stats["batches"] += 1
+        except Exception as e:
+            self.stats["failed"] += len(batch)
+            print(f"Error writing batch: {e}")
+    
+    async def drain(self):
+        """Flush everything queued and stop the writer"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._executor.shutdown(wait=True)
+
+write_queue = WriteBehindQueue(WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_FLUSH_INTERVAL, WRITE_QUEUE_MAX_SIZE)
+
+# Schema migrations: each runs once, in order, inside its own transaction
+def migrate_initial_schema(cursor: sqlite3.Cursor):
+    """Tables that existed before versioned migrations"""
     # Create users table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -82,8 +472,267 @@ def init_database():
         )
     """)
     
-    conn.commit()
-    conn.close()
+    # Create persistent tier of the tutoring response cache
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            cache_key TEXT PRIMARY KEY,
+            endpoint TEXT NOT NULL,
+            value TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    
+    # Create feedback table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+def migrate_hot_path_indexes(cursor: sqlite3.Cursor):
+    """Indexes for history lookups and a maintained per-session message count"""
+    # Latest session per user (save_chat_to_history, /chat-history)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated
+        ON chat_sessions (user_id, updated_at DESC)
+    """)
+    
+    # Messages of a session
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_session
+        ON chat_messages (session_id)
+    """)
+    
+    # Denormalized counter so history listing does not scan chat_messages
+    cursor.execute("ALTER TABLE chat_sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("""
+        UPDATE chat_sessions
+        SET message_count = (
+            SELECT COUNT(*) FROM chat_messages WHERE chat_messages.session_id = chat_sessions.id
+        )
+    """)
+
+def migrate_user_stats(cursor: sqlite3.Cursor):
+    """Per-user stats rollup and daily activity, maintained by the chat write path"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_chats INTEGER NOT NULL DEFAULT 0,
+            total_messages INTEGER NOT NULL DEFAULT 0,
+            current_streak INTEGER NOT NULL DEFAULT 0,
+            last_active_date TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_daily_activity (
+            user_id INTEGER NOT NULL,
+            activity_date TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, activity_date)
+        ) WITHOUT ROWID
+    """)
+    
+    # Backfill from existing history
+    cursor.execute("""
+        INSERT INTO user_daily_activity (user_id, activity_date, message_count)
+        SELECT cs.user_id, DATE(cm.created_at), COUNT(*)
+        FROM chat_messages cm
+        JOIN chat_sessions cs ON cm.session_id = cs.id
+        GROUP BY cs.user_id, DATE(cm.created_at)
+    """)
+    cursor.execute("""
+        INSERT INTO user_stats (user_id, total_chats, total_messages)
+        SELECT user_id, COUNT(*), SUM(message_count)
+        FROM chat_sessions
+        GROUP BY user_id
+    """)
+    
+    # Streak = run of consecutive active days ending at the latest active day
+    cursor.execute("SELECT user_id, activity_date FROM user_daily_activity ORDER BY user_id, activity_date DESC")
+    active_days = {}
+    for user_id, activity_date in cursor.fetchall():
+        active_days.setdefault(user_id, []).append(activity_date)
+    
+    streaks = []
+    for user_id, dates in active_days.items():
+        streak = 1
+        for newer, older in zip(dates, dates[1:]):
+            gap = datetime.strptime(newer, "%Y-%m-%d") - datetime.strptime(older, "%Y-%m-%d")
+            if gap != timedelta(days=1):
+                break
+            streak += 1
+        streaks.append((streak, dates[0], user_id))
+    cursor.executemany(
+        "UPDATE user_stats SET current_streak = ?, last_active_date = ? WHERE user_id = ?",
+        streaks
+    )
+
+def migrate_history_keyset_indexes(cursor: sqlite3.Cursor):
+    """Indexes matching the keyset order of history pages"""
+    # Sessions page: WHERE user_id = ? AND (updated_at, id) < (?, ?) ORDER BY updated_at DESC, id DESC
+    cursor.execute("DROP INDEX IF EXISTS idx_chat_sessions_user_updated")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated_id
+        ON chat_sessions (user_id, updated_at DESC, id DESC, session_title, created_at, message_count)
+    """)
+    
+    # Messages page: WHERE session_id = ? AND id < ? ORDER BY id DESC
+    cursor.execute("DROP INDEX IF EXISTS idx_chat_messages_session")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id
+        ON chat_messages (session_id, id)
+    """)
+
+def migrate_session_summaries(cursor: sqlite3.Cursor):
+    """Rolling summary of the turns that no longer fit in the chat context window"""
+    cursor.execute("ALTER TABLE chat_sessions ADD COLUMN summary TEXT")
+    # Highest chat_messages.id already folded into summary
+    cursor.execute("ALTER TABLE chat_sessions ADD COLUMN summary_upto_id INTEGER NOT NULL DEFAULT 0")
+
+def migrate_rate_limit_usage(cursor: sqlite3.Cursor):
+    """Daily request/token counters persisted by the rate limiter"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rate_limit_usage (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            requests INTEGER NOT NULL DEFAULT 0,
+            tokens INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+    """)
+
+def migrate_llm_usage(cursor: sqlite3.Cursor):
+    """Append-only ledger of upstream completions plus hourly and daily rollups"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TIMESTAMP NOT NULL,
+            user_id INTEGER NOT NULL,
+            plan TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            model TEXT NOT NULL,
+            stream BOOLEAN NOT NULL,
+            prompt_tokens INTEGER NOT NULL,
+            completion_tokens INTEGER NOT NULL,
+            cached_tokens INTEGER NOT NULL
+        )
+    """)
+    
+    # user_id 0 = not attributable to a user (e.g. startup jobs)
+    for table, period in (("llm_usage_hourly", "hour"), ("llm_usage_daily", "day")):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                {period} TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                plan TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_tokens INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY ({period}, user_id, plan, endpoint)
+            ) WITHOUT ROWID
+        """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_daily_user ON llm_usage_daily (user_id, day)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage (created_at)")
+
+def migrate_lesson_library(cursor: sqlite3.Cursor):
+    """Pregenerated lessons for the topic catalog, plus leases for jobs only one worker should run"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lesson_library (
+            topic_key TEXT NOT NULL,
+            level TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            content TEXT NOT NULL,
+            model TEXT NOT NULL,
+            prompt_version INTEGER NOT NULL,
+            generated_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (topic_key, level)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lesson_library_generated ON lesson_library (generated_at)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+
+MIGRATIONS = [
+    (1, "initial schema", migrate_initial_schema),
+    (2, "hot path indexes and session message_count", migrate_hot_path_indexes),
+    (3, "user stats rollup and daily activity", migrate_user_stats),
+    (4, "keyset indexes for chat history pages", migrate_history_keyset_indexes),
+    (5, "rolling conversation summaries", migrate_session_summaries),
+    (6, "daily rate limit usage", migrate_rate_limit_usage),
+    (7, "llm usage ledger and rollups", migrate_llm_usage),
+    (8, "lesson library and job leases", migrate_lesson_library),
+]
+
+def get_schema_version() -> int:
+    """Highest applied migration version"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cursor.fetchone()[0]
+
+def init_database():
+    """Initialize SQLite database by applying pending schema migrations"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    
+    current_version = get_schema_version()
+    for version, name, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            # Take the write lock first so concurrent workers cannot apply the same migration twice
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,))
+            if cursor.fetchone():
+                continue
+            migrate(cursor)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                (version, name)
+            )
+        print(f"Applied schema migration {version}: {name}")
+
+def prepare_database():
+    """Migrate and prune once per deployment; start.py --production runs this before forking workers"""
+    init_database()
+    response_cache.prune()
+    prune_llm_usage()
+
+# Heavy dependencies are imported on first use; a worker loads them in the background once it is serving
+WARM_UP_IMPORTS = os.getenv("WARM_UP_IMPORTS", "1") == "1"
+
+def warm_up_lazy_imports():
+    """Import the lazily loaded dependencies off the event loop"""
+    try:
+        if OPENAI_API_KEY:
+            llm_client()
+        password_context()
+        import jose.jwt
+    except Exception as e:
+        print(f"Error warming up imports: {str(e)}")
 
 # CORS middleware
 app.add_middleware(
@@ -93,21 +742,679 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)  # Added last = outermost, so timings cover the whole stack
 
 # Startup event
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on application startup"""
-    init_database()
+    if not SKIP_DB_INIT:
+        prepare_database()
+    write_queue.start()
+    rate_limiter.start()
+    if os.getenv("GOOGLE_CLIENT_ID"):
+        google_certs.start()
+    try:
+        static_bundle.load()
+    except Exception as e:
+        # Pages fall back to the unprocessed files
+        print(f"Static asset pipeline unavailable: {str(e)}")
+    if WARM_UP_IMPORTS:
+        asyncio.get_running_loop().run_in_executor(None, warm_up_lazy_imports)
+    if NEAR_DUP_CACHE:
+        near_dup_index.start()
+    if LESSON_REFRESH_INTERVAL > 0 and OPENAI_API_KEY:
+        lesson_library.start()
+
+# Shutdown event
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release pooled upstream and database connections on application shutdown"""
+    if _llm_client is not None:
+        await _llm_client.close()
+    rate_limiter.close()
+    near_dup_index.close()
+    lesson_library.close()
+    await write_queue.drain()
+    db_pool.close()
+    password_executor.shutdown(wait=False)
+    await google_certs.close()
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/src", StaticFiles(directory="src"), name="src")
 
+# Static asset pipeline: minified, fingerprinted and precompressed files built by build_assets.py
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PAGE_CACHE_CONTROL = "no-cache"
+ASSET_MEDIA_TYPES = {
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+}
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """Pick the best precompressed variant the client accepts"""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+class StaticBundle:
+    """Built assets and pages held in memory together with their encoded variants"""
+    
+    def __init__(self):
+        self.assets = {}  # fingerprinted file name -> entry
+        self.pages = {}   # source page path -> entry
+    
+    @staticmethod
+    def _read_entry(dist: Path, name: str, etag: str, encodings: list) -> dict:
+        return {
+            "etag": f'W/"{etag}"',
+            "media_type": ASSET_MEDIA_TYPES.get(Path(name).suffix, "application/octet-stream"),
+            "identity": (dist / name).read_bytes(),
+            **{
+                encoding: (dist / f"{name}.{'gz' if encoding == 'gzip' else encoding}").read_bytes()
+                for encoding in encodings
+            }
+        }
+    
+    def load(self):
+        """Load the manifest (building it if the sources changed) and the files it lists"""
+        manifest = build_assets.load_or_build()
+        dist = Path(build_assets.DIST_DIR)
+        self.assets = {
+            entry["file"]: self._read_entry(dist, entry["file"], entry["etag"], entry["encodings"])
+            for entry in manifest["assets"].values()
+        }
+        self.pages = {
+            path: self._read_entry(dist, entry["file"], entry["etag"], entry["encodings"])
+            for path, entry in manifest["pages"].items()
+        }
+    
+    @staticmethod
+    def respond(entry: dict, request: Request, cache_control: str) -> Response:
+        """Serve an entry with ETag revalidation and Content-Encoding negotiation"""
+        headers = {"ETag": entry["etag"], "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if_none_match = request.headers.get("if-none-match", "")
+        if entry["etag"] in if_none_match or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""), entry)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=entry[encoding], media_type=entry["media_type"], headers=headers)
+    
+    def page(self, path: str, request: Request) -> Response:
+        """Serve an HTML page with its asset references rewritten"""
+        entry = self.pages.get(path)
+        if entry is None:
+            return FileResponse(path)
+        return self.respond(entry, request, PAGE_CACHE_CONTROL)
+
+static_bundle = StaticBundle()
+
+@app.get("/assets/{name}")
+async def fingerprinted_asset(name: str, request: Request):
+    """Serve a fingerprinted asset; its name changes whenever its content does"""
+    entry = static_bundle.assets.get(name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return static_bundle.respond(entry, request, ASSET_CACHE_CONTROL)
+
 # OpenAI configuration
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY") or os.getenv("REPLIT_SECRET")
-)
+LLM_MODEL = "gpt-4o-mini"  # Using GPT-4o-mini for better performance and cost
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))  # Max in-flight upstream calls per worker
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 64))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 32))
+# USD per million tokens, used by /usage-report
+LLM_PRICE_INPUT_PER_MTOK = float(os.getenv("LLM_PRICE_INPUT_PER_MTOK", "0.15"))
+LLM_PRICE_CACHED_INPUT_PER_MTOK = float(os.getenv("LLM_PRICE_CACHED_INPUT_PER_MTOK", "0.075"))
+LLM_PRICE_OUTPUT_PER_MTOK = float(os.getenv("LLM_PRICE_OUTPUT_PER_MTOK", "0.60"))
+LLM_USAGE_LEDGER_DAYS = int(os.getenv("LLM_USAGE_LEDGER_DAYS", "90"))  # Raw rows and hourly rollups kept; daily rollups are kept
+USAGE_REPORT_TOKEN = os.getenv("USAGE_REPORT_TOKEN")  # /usage-report is disabled unless set
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or os.getenv("REPLIT_SECRET")
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+def llm_client():
+    """Shared async client; one pooled HTTP transport is reused by every request
+    
+    Created on first use: importing the OpenAI SDK is the slowest part of startup.
+    """
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                import httpx
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+                _llm_client = AsyncOpenAI(
+                    api_key=OPENAI_API_KEY,
+                    max_retries=0,  # Retries, deadlines and backoff are handled by llm_chat
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=httpx.Limits(
+                            max_connections=LLM_MAX_CONNECTIONS,
+                            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS
+                        )
+                    )
+                )
+    return _llm_client
+
+# Caps concurrent upstream calls so a burst cannot exhaust the connection pool
+llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+# (user_id, plan) the current request's LLM tokens are charged to; set by rate_limited_user
+llm_caller: ContextVar[Optional[tuple]] = ContextVar("llm_caller", default=None)
+
+def record_llm_usage(model: str, stream: bool, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+    """Count upstream token usage, charge it to the caller's quota and append it to the usage ledger"""
+    endpoint = current_route()
+    llm_tokens_total.inc(prompt_tokens, endpoint=endpoint, kind="prompt")
+    llm_tokens_total.inc(completion_tokens, endpoint=endpoint, kind="completion")
+    caller = llm_caller.get()
+    if caller and prompt_tokens + completion_tokens:
+        rate_limiter.record_tokens(caller[0], caller[1], prompt_tokens + completion_tokens)
+    
+    user_id, plan = caller if caller else (0, "none")
+    write_queue.submit(
+        write_llm_usage, datetime.utcnow(), user_id, plan, endpoint, model, stream,
+        prompt_tokens, completion_tokens, cached_tokens
+    )
+
+def prune_llm_usage():
+    """Drop ledger rows and hourly rollups past the retention window"""
+    cutoff = datetime.utcnow() - timedelta(days=LLM_USAGE_LEDGER_DAYS)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM llm_usage WHERE created_at < ?", (cutoff.strftime("%Y-%m-%d %H:%M:%S"),))
+        cursor.execute("DELETE FROM llm_usage_hourly WHERE hour < ?", (cutoff.strftime("%Y-%m-%d %H:00"),))
+
+def cached_prompt_tokens(usage) -> int:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+def write_llm_usage(cursor: sqlite3.Cursor, created_at: datetime, user_id: int, plan: str, endpoint: str,
+                    model: str, stream: bool, prompt_tokens: int, completion_tokens: int, cached_tokens: int):
+    """Append one completion to the ledger and fold it into the hourly and daily rollups"""
+    cursor.execute("""
+        INSERT INTO llm_usage (created_at, user_id, plan, endpoint, model, stream,
+                               prompt_tokens, completion_tokens, cached_tokens)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (created_at.strftime("%Y-%m-%d %H:%M:%S"), user_id, plan, endpoint, model, stream,
+          prompt_tokens, completion_tokens, cached_tokens))
+    
+    for table, period, key in (
+        ("llm_usage_hourly", "hour", created_at.strftime("%Y-%m-%d %H:00")),
+        ("llm_usage_daily", "day", created_at.strftime("%Y-%m-%d")),
+    ):
+        cursor.execute(f"""
+            INSERT INTO {table} ({period}, user_id, plan, endpoint, requests, prompt_tokens, completion_tokens, cached_tokens)
+            VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT ({period}, user_id, plan, endpoint) DO UPDATE SET
+                requests = requests + 1,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                completion_tokens = completion_tokens + excluded.completion_tokens,
+                cached_tokens = cached_tokens + excluded.cached_tokens
+        """, (key, user_id, plan, endpoint, prompt_tokens, completion_tokens, cached_tokens))
+
+# Upstream resilience: per-endpoint deadlines, jittered retries, a circuit breaker and optional hedging
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))  # Whole call, retries included
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "20"))  # Max gap between streamed chunks
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))  # Seconds; doubles per retry, full jitter
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # Consecutive failed attempts that open the circuit
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))  # Seconds open before one probe is let through
+LLM_HEDGE_AFTER_MS = float(os.getenv("LLM_HEDGE_AFTER_MS", "0"))  # 0 = off; else duplicate slower non-streaming calls
+
+def parse_deadlines(value: str) -> dict:
+    """"/chat=25,/lesson=45" -> {"/chat": 25.0, "/lesson": 45.0}"""
+    deadlines = {}
+    for item in value.split(","):
+        if "=" in item:
+            endpoint, seconds = item.split("=", 1)
+            deadlines[endpoint.strip()] = float(seconds)
+    return deadlines
+
+# Streaming endpoints: the deadline covers the first token, later chunks get LLM_STREAM_IDLE_TIMEOUT each
+LLM_DEADLINES = {
+    "/chat/stream": 15.0,
+    "/pronunciation": 20.0,
+    "/pronunciation/batch": 20.0,  # Per word
+    "/lesson": 45.0,
+    "background": 60.0,
+    **parse_deadlines(os.getenv("LLM_DEADLINES", "")),
+}
+
+class UpstreamTimeout(Exception):
+    """The endpoint's LLM deadline passed"""
+
+class UpstreamUnavailable(Exception):
+    """The circuit breaker is open: the upstream keeps failing, so calls fail fast"""
+
+def is_retryable(error: Exception) -> bool:
+    """Transient upstream failures: timeouts, connection errors, 429 and 5xx"""
+    if isinstance(error, TimeoutError):
+        return True
+    import openai
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+def retry_delay(retry: int, error: Exception) -> float:
+    """Exponential backoff with full jitter; a Retry-After from the upstream is honoured as a floor"""
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** retry))
+    response = getattr(error, "response", None)
+    try:
+        retry_after = float(response.headers.get("retry-after")) if response is not None else 0.0
+    except (TypeError, ValueError):
+        retry_after = 0.0
+    return max(delay, min(retry_after, LLM_RETRY_MAX_DELAY))
+
+class CircuitBreaker:
+    """Fail fast while the upstream is down: opens after consecutive failures, probes once per cooldown"""
+    
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.stats = {"opened": 0, "rejected": 0}
+    
+    def before_call(self):
+        """Admit one upstream attempt or raise UpstreamUnavailable"""
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "open" or (self.state == "half_open" and self._probing):
+            self.stats["rejected"] += 1
+            raise UpstreamUnavailable("LLM upstream circuit is open")
+        if self.state == "half_open":
+            self._probing = True
+    
+    def record(self, healthy: Optional[bool]):
+        """Outcome of an admitted attempt; None means it was abandoned (e.g. a cancelled hedge)"""
+        was_probe = self._probing
+        self._probing = False
+        if healthy is None:
+            return
+        if healthy:
+            self.failures = 0
+            self.state = "closed"
+            return
+        self.failures += 1
+        if was_probe or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+    
+    def snapshot(self) -> dict:
+        return {**self.stats, "state": self.state, "consecutive_failures": self.failures}
+
+llm_breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+
+async def with_llm_retries(endpoint: str, deadline: float, attempt):
+    """Await attempt(timeout) until it succeeds, fails permanently, runs out of retries or passes the deadline"""
+    for retry in range(LLM_MAX_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise UpstreamTimeout(f"LLM deadline passed for {endpoint}")
+        try:
+            return await attempt(remaining)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            delay = retry_delay(retry, e)
+            if retry == LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                if isinstance(e, TimeoutError):
+                    raise UpstreamTimeout(f"LLM deadline passed for {endpoint}") from e
+                raise
+            llm_retries_total.inc(endpoint=endpoint, reason=str(getattr(e, "status_code", None) or type(e).__name__))
+            await asyncio.sleep(delay)
+
+async def upstream_completion(messages: List[dict], params: dict, timeout: float):
+    """One non-streaming upstream request, guarded by the circuit breaker"""
+    llm_breaker.before_call()
+    healthy = None
+    try:
+        response = await asyncio.wait_for(
+            llm_client().chat.completions.create(messages=messages, timeout=timeout, **params), timeout
+        )
+        healthy = True
+        return response
+    except Exception as e:
+        # 4xx other than 429 are our fault, not a sign of upstream trouble
+        healthy = not is_retryable(e)
+        raise
+    finally:
+        llm_breaker.record(healthy)
+
+async def hedged_completion(endpoint: str, messages: List[dict], params: dict, timeout: float):
+    """upstream_completion, plus a second copy if the first is slower than LLM_HEDGE_AFTER_MS; first answer wins"""
+    if LLM_HEDGE_AFTER_MS <= 0:
+        return await upstream_completion(messages, params, timeout)
+    
+    started = time.monotonic()
+    primary = asyncio.create_task(upstream_completion(messages, params, timeout))
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=min(LLM_HEDGE_AFTER_MS / 1000, timeout))
+        # No hedging into a struggling upstream or a saturated gateway
+        if done or llm_breaker.state != "closed" or llm_semaphore.locked():
+            return await primary
+        
+        hedge = asyncio.create_task(upstream_completion(messages, params, timeout - (time.monotonic() - started)))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    llm_hedges_total.inc(endpoint=endpoint, outcome="hedge_won" if task is hedge else "primary_won")
+                    return task.result()
+        llm_hedges_total.inc(endpoint=endpoint, outcome="both_failed")
+        raise primary.exception()
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+async def llm_chat(messages: List[dict], **params):
+    """Run a chat completion through the shared non-blocking LLM gateway (deadline, retries, breaker, hedging)"""
+    params.setdefault("model", LLM_MODEL)
+    endpoint = current_route()
+    deadline = time.monotonic() + LLM_DEADLINES.get(endpoint, LLM_DEADLINE_SECONDS)
+    async with llm_semaphore:
+        llm_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            response = await with_llm_retries(
+                endpoint, deadline, lambda timeout: hedged_completion(endpoint, messages, params, timeout)
+            )
+        except Exception as e:
+            errors_total.inc(type=type(e).__name__, where="upstream")
+            raise
+        finally:
+            llm_requests_in_flight.dec()
+            llm_duration.observe(time.perf_counter() - started, endpoint=endpoint, stream="false")
+    if response.usage:
+        record_llm_usage(params["model"], False, response.usage.prompt_tokens,
+                         response.usage.completion_tokens, cached_prompt_tokens(response.usage))
+    return response
+
+async def llm_chat_stream(messages: List[dict], **params):
+    """Stream completion text deltas through the shared LLM gateway"""
+    params.setdefault("model", LLM_MODEL)
+    endpoint = current_route()
+    deadline = time.monotonic() + LLM_DEADLINES.get(endpoint, LLM_DEADLINE_SECONDS)
+    usage = None
+    streamed_chars = 0
+    stream = None
+    
+    async def open_stream(timeout: float):
+        """Start the stream and wait for its first chunk; failures up to here can still be retried"""
+        llm_breaker.before_call()
+        healthy = None
+        opened = None
+        result = None
+        
+        async def first_chunk():
+            nonlocal opened
+            opened = await llm_client().chat.completions.create(
+                messages=messages, stream=True, stream_options={"include_usage": True},
+                timeout=max(timeout, LLM_STREAM_IDLE_TIMEOUT), **params
+            )
+            chunks = opened.__aiter__()
+            return opened, chunks, await chunks.__anext__()
+        
+        try:
+            result = await asyncio.wait_for(first_chunk(), timeout)
+            healthy = True
+            return result
+        except Exception as e:
+            healthy = not is_retryable(e)
+            raise
+        finally:
+            llm_breaker.record(healthy)
+            # An abandoned attempt must not keep its upstream connection
+            if result is None and opened is not None:
+                await opened.close()
+    
+    async with llm_semaphore:
+        llm_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            stream, chunks, chunk = await with_llm_retries(endpoint, deadline, open_stream)
+            while True:
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if not streamed_chars:
+                        llm_first_token.observe(time.perf_counter() - started, endpoint=endpoint)
+                    streamed_chars += len(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), LLM_STREAM_IDLE_TIMEOUT)
+                except StopAsyncIteration:
+                    break
+                except TimeoutError as e:
+                    raise UpstreamTimeout(f"LLM stream stalled for {endpoint}") from e
+        except Exception as e:
+            errors_total.inc(type=type(e).__name__, where="upstream")
+            raise
+        finally:
+            if stream is not None:
+                await stream.close()
+            llm_requests_in_flight.dec()
+            llm_duration.observe(time.perf_counter() - started, endpoint=endpoint, stream="true")
+            # Usage arrives in the last chunk; estimate if the stream ended early
+            if usage:
+                record_llm_usage(params["model"], True, usage.prompt_tokens, usage.completion_tokens,
+                                 cached_prompt_tokens(usage))
+            elif stream is not None:
+                record_llm_usage(params["model"], True,
+                                 sum(len(message["content"]) for message in messages) // 4, streamed_chars // 4)
+
+# Response cache for the deterministic tutoring endpoints
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 2048))  # In-memory LRU size
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 7 * 24 * 3600))  # Fresh for 7 days
+RESPONSE_CACHE_STALE_TTL = int(os.getenv("RESPONSE_CACHE_STALE_TTL", 30 * 24 * 3600))  # Served only if upstream fails
+
+# Uzbek Cyrillic -> Latin so both scripts share one cache entry
+UZBEK_CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo", "ж": "j",
+    "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "x", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sh", "ъ": "'", "ы": "i", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya", "ў": "o'", "қ": "q", "ғ": "g'", "ҳ": "h"
+}
+UZBEK_APOSTROPHES = "\u2018\u2019\u02bb\u02bc`´"  # o‘, o’, oʻ ... all become o'
+UZBEK_TRANSLATION_TABLE = str.maketrans({
+    **UZBEK_CYRILLIC_TO_LATIN,
+    **{mark: "'" for mark in UZBEK_APOSTROPHES}
+})
+
+def normalize_cache_text(text: str) -> str:
+    """Normalize user input for cache keys (casefold, collapse spaces, unify Uzbek scripts)"""
+    text = text.casefold()
+    text = re.sub(r"(?<![а-яёўқғҳ])е", "ye", text)  # Word-initial е is written "ye" in Latin
+    text = text.translate(UZBEK_TRANSLATION_TABLE)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" .,!?;:\"")
+
+class ResponseCache:
+    """In-memory LRU with TTL in front of a persistent SQLite tier"""
+    
+    def __init__(self, max_entries: int, ttl: int, stale_ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()  # cache_key -> (value, created_at)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale_served": 0, "stores": 0}
+    
+    @staticmethod
+    def make_key(endpoint: str, *parts: str) -> str:
+        """Build a cache key from the endpoint name and normalized inputs"""
+        normalized = "\x1f".join(normalize_cache_text(part) for part in parts)
+        return hashlib.sha256(f"{endpoint}\x1e{normalized}".encode("utf-8")).hexdigest()
+    
+    def _remember(self, key: str, value: str, created_at: float):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _lookup(self, key: str, max_age: int):
+        """Return (value, tier) if an entry younger than max_age exists"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry and now - entry[1] <= max_age:
+            self._entries.move_to_end(key)
+            return entry[0], "memory"
+        
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value, created_at FROM response_cache WHERE cache_key = ?", (key,))
+            row = cursor.fetchone()
+        
+        if row and now - row[1] <= max_age:
+            self._remember(key, row[0], row[1])
+            return row[0], "disk"
+        return None, None
+    
+    def get(self, key: str) -> Optional[str]:
+        """Get a fresh cached value"""
+        value, tier = self._lookup(key, self.ttl)
+        if tier == "memory":
+            self.stats["memory_hits"] += 1
+        elif tier == "disk":
+            self.stats["disk_hits"] += 1
+        else:
+            self.stats["misses"] += 1
+        return value
+    
+    def get_stale(self, key: str) -> Optional[str]:
+        """Get an expired-but-kept value, used when the upstream is failing"""
+        value, _ = self._lookup(key, self.stale_ttl)
+        if value is not None:
+            self.stats["stale_served"] += 1
+        return value
+    
+    def set(self, key: str, endpoint: str, value: str):
+        """Store a value in both tiers"""
+        created_at = time.time()
+        self._remember(key, value, created_at)
+        
+        write_queue.submit(self._write_entry, key, endpoint, value, created_at)
+        self.stats["stores"] += 1
+    
+    @staticmethod
+    def _write_entry(cursor: sqlite3.Cursor, key: str, endpoint: str, value: str, created_at: float):
+        cursor.execute("""
+            INSERT OR REPLACE INTO response_cache (cache_key, endpoint, value, created_at)
+            VALUES (?, ?, ?, ?)
+        """, (key, endpoint, value, created_at))
+    
+    def prune(self):
+        """Drop persistent entries that are too old to be served even as stale"""
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM response_cache WHERE created_at < ?", (time.time() - self.stale_ttl,))
+    
+    def snapshot(self) -> dict:
+        """Counters for monitoring"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "memory_entries": len(self._entries),
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_STALE_TTL)
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key"""
+    
+    def __init__(self):
+        self._calls = {}  # key -> asyncio.Task
+        self.stats = {"leaders": 0, "coalesced": 0}
+        self.coalesced_by_endpoint = {}
+    
+    async def do(self, key: str, endpoint: str, fn):
+        """Await fn() once per key; callers arriving while it runs get the same result (or exception)"""
+        task = self._calls.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            # A separate task, so a disconnecting leader does not cancel the call for everyone else
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.stats["coalesced"] += 1
+            self.coalesced_by_endpoint[endpoint] = self.coalesced_by_endpoint.get(endpoint, 0) + 1
+        return await asyncio.shield(task)
+    
+    def snapshot(self) -> dict:
+        """Counters for monitoring"""
+        calls = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self._calls),
+            "coalesced_by_endpoint": dict(self.coalesced_by_endpoint),
+            "coalesce_rate": round(self.stats["coalesced"] / calls, 4) if calls else 0.0
+        }
+
+llm_flight = SingleFlight()
+
+async def cached_completion(endpoint: str, key_parts: tuple, messages: List[dict], **params) -> str:
+    """Serve a tutoring completion from the response cache, calling the LLM on a miss"""
+    key = response_cache.make_key(endpoint, *key_parts)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    return await complete_and_cache(endpoint, key, messages, **params)
+
+async def complete_and_cache(endpoint: str, key: str, messages: List[dict], **params) -> str:
+    """Cache-miss path of cached_completion: call the LLM and store the answer under key"""
+    async def fetch() -> str:
+        try:
+            response = await llm_chat(messages=messages, **params)
+        except Exception:
+            # Upstream is failing: an old answer is better than an error
+            stale = response_cache.get_stale(key)
+            if stale is not None:
+                return stale
+            raise
+        
+        content = response.choices[0].message.content
+        if content:
+            response_cache.set(key, endpoint, content)
+        return content
+    
+    # Identical requests that miss together (a classroom asking the same word) share one upstream call
+    return await llm_flight.do(key, endpoint, fetch)
 
 # Pydantic models
 class UserCreate(BaseModel):
@@ -144,6 +1451,9 @@ class LessonRequest(BaseModel):
 
 class PronunciationRequest(BaseModel):
     word: str
+
+class PronunciationBatchRequest(BaseModel):
+    words: List[str]
     
 class GrammarRequest(BaseModel):
     uzbek_sentence: str
@@ -157,14 +1467,60 @@ class ProverbRequest(BaseModel):
 class GoogleAuthRequest(BaseModel):
     credential: str
 
+class TTLCache:
+    """Bounded in-process LRU mapping whose entries expire after a TTL"""
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+    
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[1] < time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def pop(self, key):
+        self._entries.pop(key, None)
+    
+    def __len__(self):
+        return len(self._entries)
+
+token_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL)  # sha256(token) -> email
+user_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_TTL)  # email -> user record
+last_login_cache = TTLCache(AUTH_CACHE_MAX_ENTRIES, LAST_LOGIN_INTERVAL)  # email -> last_login recently written
+
 # Utility functions for authentication
-def verify_password(plain_password, hashed_password):
-    """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def run_password_job(fn, *args):
+    """Run a bcrypt call in the password worker pool"""
+    if password_job_slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Server band. Iltimos, birozdan keyin qayta urinib ko'ring",
+            headers={"Retry-After": "1"}
+        )
+    async with password_job_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, fn, *args)
+
+async def verify_password(plain_password, hashed_password):
+    """Verify a password against its hash; returns (valid, upgraded hash or None)"""
+    return await run_password_job(password_context().verify_and_update, plain_password, hashed_password)
 
-def get_password_hash(password):
+async def get_password_hash(password):
     """Hash a password"""
-    return pwd_context.hash(password)
+    return await run_password_job(password_context().hash, password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
@@ -174,16 +1530,16 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def get_user_by_email(email: str):
     """Get user from database by email"""
-    conn = sqlite3.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-    user = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
+        user = cursor.fetchone()
     
     if user:
         return {
@@ -199,93 +1555,360 @@ def get_user_by_email(email: str):
         }
     return None
 
-def create_user(user_data: UserCreate):
+async def create_user(user_data: UserCreate):
     """Create new user in database"""
-    conn = sqlite3.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     
     try:
-        cursor.execute("""
-            INSERT INTO users (email, full_name, hashed_password) 
-            VALUES (?, ?, ?)
-        """, (user_data.email, user_data.full_name, hashed_password))
-        
-        user_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO users (email, full_name, hashed_password) 
+                VALUES (?, ?, ?)
+            """, (user_data.email, user_data.full_name, hashed_password))
         
         return get_user_by_email(user_data.email)
     except sqlite3.IntegrityError:
-        conn.close()
         raise HTTPException(
             status_code=400,
             detail="Bu email manzil allaqachon ro'yxatdan o'tgan"
         )
 
-def authenticate_user(email: str, password: str):
+async def authenticate_user(email: str, password: str):
     """Authenticate user credentials"""
     user = get_user_by_email(email)
     if not user:
         return False
-    if not verify_password(password, user["hashed_password"]):
+    valid, upgraded_hash = await verify_password(password, user["hashed_password"])
+    if not valid:
         return False
+    if upgraded_hash:
+        # Hash was made with a different cost factor; store the re-hashed password
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET hashed_password = ? WHERE id = ?",
+                (upgraded_hash, user["id"])
+            )
+        invalidate_user_cache(email)
     return user
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current authenticated user from JWT token"""
+    with auth_duration.time():
+        return authenticate_token(credentials.credentials)
+
+def authenticate_token(token: str) -> dict:
+    """Resolve a bearer token to its user (token and user caches first)"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Avtorizatsiya talab qilinadi",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    token_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    email = token_cache.get(token_key)
+    
+    if email is None:
+        from jose import JWTError, jwt
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        
+        # Never trust a cached token past its own expiry
+        expires_in = payload.get("exp", 0) - datetime.utcnow().timestamp()
+        token_cache.set(token_key, email, ttl=min(AUTH_CACHE_TTL, max(expires_in, 0)))
     
-    user = get_user_by_email(email)
+    user = get_cached_user(email)
     if user is None:
         raise credentials_exception
     
-    # Update last login
-    conn = sqlite3.connect(DATABASE_URL)
-    cursor = conn.cursor()
+    touch_last_login(email)
+    
+    return user
+
+def get_cached_user(email: str):
+    """Get user record from the auth cache, falling back to the database"""
+    user = user_cache.get(email)
+    if user is None:
+        user = get_user_by_email(email)
+        if user is not None:
+            user_cache.set(email, user)
+    return user
+
+def invalidate_user_cache(email: str):
+    """Drop a cached user record after the row changes"""
+    user_cache.pop(email)
+
+def touch_last_login(email: str):
+    """Update last_login, coalesced to at most once per LAST_LOGIN_INTERVAL per user"""
+    if last_login_cache.get(email):
+        return
+    last_login_cache.set(email, True)
+    write_queue.submit(write_last_login, email)
+
+def write_last_login(cursor: sqlite3.Cursor, email: str):
+    """Stamp the user's last_login"""
     cursor.execute(
         "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE email = ?",
         (email,)
     )
-    conn.commit()
-    conn.close()
-    
-    return user
 
 def update_user_subscription(user_id: int, plan: str, expires: Optional[datetime] = None):
     """Update user subscription plan"""
-    conn = sqlite3.connect(DATABASE_URL)
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        
+        if expires:
+            cursor.execute("""
+                UPDATE users 
+                SET subscription_plan = ?, subscription_expires = ? 
+                WHERE id = ?
+            """, (plan, expires.isoformat(), user_id))
+        else:
+            cursor.execute("""
+                UPDATE users 
+                SET subscription_plan = ? 
+                WHERE id = ?
+            """, (plan, user_id))
+        
+        cursor.execute("SELECT email FROM users WHERE id = ?", (user_id,))
+        row = cursor.fetchone()
     
-    if expires:
-        cursor.execute("""
-            UPDATE users 
-            SET subscription_plan = ?, subscription_expires = ? 
-            WHERE id = ?
-        """, (plan, expires.isoformat(), user_id))
-    else:
-        cursor.execute("""
-            UPDATE users 
-            SET subscription_plan = ? 
-            WHERE id = ?
-        """, (plan, user_id))
+    # Plan checks must see the new subscription right away
+    if row:
+        invalidate_user_cache(row[0])
+
+# Plan-aware rate limiting: per-minute token buckets and per-UTC-day quotas for
+# requests and LLM tokens, kept in memory per worker and persisted periodically.
+# Daily quotas are shared by all workers, but each worker has its own minute buckets:
+# under `start.py --production` a user can get up to WEB_CONCURRENCY times the
+# per-minute limits (when their requests land on different workers).
+RATE_LIMITS = {
+    "free": {
+        "requests_per_minute": int(os.getenv("FREE_REQUESTS_PER_MINUTE", "10")),
+        "requests_per_day": int(os.getenv("FREE_REQUESTS_PER_DAY", "200")),
+        "tokens_per_minute": int(os.getenv("FREE_TOKENS_PER_MINUTE", "20000")),
+        "tokens_per_day": int(os.getenv("FREE_TOKENS_PER_DAY", "100000")),
+    },
+    "premium": {
+        "requests_per_minute": int(os.getenv("PREMIUM_REQUESTS_PER_MINUTE", "60")),
+        "requests_per_day": int(os.getenv("PREMIUM_REQUESTS_PER_DAY", "5000")),
+        "tokens_per_minute": int(os.getenv("PREMIUM_TOKENS_PER_MINUTE", "100000")),
+        "tokens_per_day": int(os.getenv("PREMIUM_TOKENS_PER_DAY", "2000000")),
+    },
+}
+RATE_LIMIT_PERSIST_INTERVAL = float(os.getenv("RATE_LIMIT_PERSIST_INTERVAL", "30"))
+RATE_LIMIT_IDLE_SECONDS = 300  # Fully refilled, persisted users are dropped from memory after this
+
+class RateLimiter:
+    """Per-user request and LLM-token limits keyed by subscription plan
+    
+    Minute buckets are per worker. Daily counters are shared: each worker adds its
+    own increments to rate_limit_usage and reads back the totals of all workers.
+    """
+    
+    def __init__(self, limits: dict, persist_interval: float):
+        self.limits = limits
+        self.persist_interval = persist_interval
+        self._state = {}  # user_id -> buckets and today's counters
+        self._dirty = set()
+        self._persist_task = None
+        self.stats = {"allowed": 0, "limited": 0}
+    
+    def limits_for(self, plan: str) -> dict:
+        return self.limits.get(plan, self.limits["free"])
+    
+    @staticmethod
+    def _load_day(user_id: int, day: str) -> tuple:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT requests, tokens FROM rate_limit_usage WHERE user_id = ? AND day = ?",
+                (user_id, day)
+            )
+            row = cursor.fetchone()
+        return row if row else (0, 0)
     
-    conn.commit()
-    conn.close()
+    def _refresh(self, user_id: int, limits: dict) -> dict:
+        """State for a user with the minute buckets refilled and the day rolled over"""
+        now = time.monotonic()
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        state = self._state.get(user_id)
+        if state is None:
+            day_requests, day_tokens = self._load_day(user_id, today)
+            state = {
+                "requests": float(limits["requests_per_minute"]),
+                "tokens": float(limits["tokens_per_minute"]),
+                "refilled_at": now,
+                "day": today,
+                "day_requests": day_requests,  # All workers, as of the last sync
+                "day_tokens": day_tokens,
+                "pending_requests": 0,  # This worker, not yet added to the database
+                "pending_tokens": 0,
+            }
+            self._state[user_id] = state
+        elif state["day"] != today:
+            state.update(day=today, day_requests=0, day_tokens=0, pending_requests=0, pending_tokens=0)
+        
+        elapsed = now - state["refilled_at"]
+        state["requests"] = min(limits["requests_per_minute"],
+                                state["requests"] + elapsed * limits["requests_per_minute"] / 60)
+        state["tokens"] = min(limits["tokens_per_minute"],
+                              state["tokens"] + elapsed * limits["tokens_per_minute"] / 60)
+        state["refilled_at"] = now
+        return state
+    
+    def check(self, user_id: int, plan: str):
+        """Admit one request or raise 429 with Retry-After"""
+        limits = self.limits_for(plan)
+        state = self._refresh(user_id, limits)
+        
+        retry_after = 0.0
+        detail = None
+        day_requests = state["day_requests"] + state["pending_requests"]
+        day_tokens = state["day_tokens"] + state["pending_tokens"]
+        if day_requests >= limits["requests_per_day"] or day_tokens >= limits["tokens_per_day"]:
+            tomorrow = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            retry_after = (tomorrow - datetime.utcnow()).total_seconds()
+            detail = "Kunlik limit tugadi. Ertaga qayta urinib ko'ring yoki Premium rejaga o'ting"
+        elif state["requests"] < 1:
+            retry_after = (1 - state["requests"]) * 60 / limits["requests_per_minute"]
+        elif state["tokens"] <= 0:
+            # Token debt from earlier answers has to be paid back first
+            retry_after = (1 - state["tokens"]) * 60 / limits["tokens_per_minute"]
+        
+        if retry_after > 0:
+            self.stats["limited"] += 1
+            seconds = max(1, math.ceil(retry_after))
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=detail or f"Juda ko'p so'rov. Iltimos, {seconds} soniyadan keyin qayta urinib ko'ring",
+                headers={"Retry-After": str(seconds)}
+            )
+        
+        state["requests"] -= 1
+        state["pending_requests"] += 1
+        self._dirty.add(user_id)
+        self.stats["allowed"] += 1
+    
+    def reserve_daily(self, user_id: int, plan: str, units: int) -> int:
+        """Charge up to `units` extra requests to today's quota only (e.g. words of a batch); returns how many fit"""
+        limits = self.limits_for(plan)
+        state = self._refresh(user_id, limits)
+        if state["day_tokens"] + state["pending_tokens"] >= limits["tokens_per_day"]:
+            return 0
+        remaining = limits["requests_per_day"] - state["day_requests"] - state["pending_requests"]
+        admitted = max(0, min(units, remaining))
+        if admitted:
+            state["pending_requests"] += admitted
+            self._dirty.add(user_id)
+        return admitted
+    
+    def record_tokens(self, user_id: int, plan: str, tokens: int):
+        """Charge LLM tokens after the fact; the minute bucket may go into debt"""
+        state = self._refresh(user_id, self.limits_for(plan))
+        state["tokens"] -= tokens
+        state["pending_tokens"] += tokens
+        self._dirty.add(user_id)
+    
+    def usage(self, user_id: int, plan: str) -> dict:
+        """Today's counters for a user"""
+        state = self._refresh(user_id, self.limits_for(plan))
+        return {
+            "day": state["day"],
+            "requests": state["day_requests"] + state["pending_requests"],
+            "tokens": state["day_tokens"] + state["pending_tokens"]
+        }
+    
+    def _take_pending(self) -> list:
+        """This worker's unsynced increments, reset to zero"""
+        rows = []
+        for user_id in self._dirty:
+            state = self._state.get(user_id)
+            if state and (state["pending_requests"] or state["pending_tokens"]):
+                rows.append((user_id, state["day"], state["pending_requests"], state["pending_tokens"]))
+                state["pending_requests"] = state["pending_tokens"] = 0
+        self._dirty.clear()
+        return rows
+    
+    def _restore_pending(self, rows: list):
+        for user_id, day, requests, tokens in rows:
+            state = self._state.get(user_id)
+            if state and state["day"] == day:
+                state["pending_requests"] += requests
+                state["pending_tokens"] += tokens
+                self._dirty.add(user_id)
+    
+    def _apply_totals(self, totals: list):
+        for user_id, day, requests, tokens in totals:
+            state = self._state.get(user_id)
+            if state and state["day"] == day:
+                state["day_requests"], state["day_tokens"] = requests, tokens
+    
+    def _evict_idle(self):
+        # Idle users are fully refilled and synced; reload them from the database when they return
+        cutoff = time.monotonic() - RATE_LIMIT_IDLE_SECONDS
+        for user_id in [uid for uid, state in self._state.items()
+                        if state["refilled_at"] < cutoff and uid not in self._dirty]:
+            del self._state[user_id]
+    
+    def persist(self):
+        """Add pending increments to the database synchronously (used at shutdown)"""
+        rows = self._take_pending()
+        if rows:
+            self._apply_totals(sync_rate_limit_usage(rows))
+    
+    async def _persist_loop(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            rows = self._take_pending()
+            try:
+                if rows:
+                    self._apply_totals(await asyncio.to_thread(sync_rate_limit_usage, rows))
+            except Exception as e:
+                self._restore_pending(rows)
+                print(f"Error persisting rate limit usage: {e}")
+            self._evict_idle()
+    
+    def start(self):
+        if self._persist_task is None:
+            self._persist_task = asyncio.create_task(self._persist_loop())
+    
+    def close(self):
+        if self._persist_task:
+            self._persist_task.cancel()
+        self.persist()
+
+def sync_rate_limit_usage(rows: list) -> list:
+    """Add one worker's daily increments and return the totals across all workers"""
+    totals = []
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        for row in rows:
+            cursor.execute("""
+                INSERT INTO rate_limit_usage (user_id, day, requests, tokens)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, day) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    tokens = tokens + excluded.tokens
+                RETURNING user_id, day, requests, tokens
+            """, row)
+            totals.append(cursor.fetchone())
+    return totals
+
+rate_limiter = RateLimiter(RATE_LIMITS, RATE_LIMIT_PERSIST_INTERVAL)
+
+async def rate_limited_user(current_user: dict = Depends(get_current_user)):
+    """get_current_user plus the plan's rate limits, for endpoints that call the LLM"""
+    plan = current_user.get("subscription_plan") or "free"
+    rate_limiter.check(current_user["id"], plan)
+    llm_caller.set((current_user["id"], plan))
+    return current_user
 
 # Enhanced System Prompt for Aspiro AI
 SYSTEM_PROMPT = """Siz Aspiro AI - O'zbekiston o'quvchilari uchun maxsus yaratilgan aqlli ta'lim yordamchisisiz! 
@@ -320,6 +1943,112 @@ SYSTEM_PROMPT = """Siz Aspiro AI - O'zbekiston o'quvchilari uchun maxsus yaratil
 
 🌟 MAQSAD: O'zbek o'quvchisini ChatGPT dan yaxshiroq tushuntirish va yordam berish!"""
 
+# Google sign-in: signing certificates are cached and tokens are checked locally
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+GOOGLE_CERTS_DEFAULT_TTL = 3600  # Used when the response carries no max-age
+GOOGLE_CERTS_REFRESH_MARGIN = 300  # Refresh this many seconds before the certs expire
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+GOOGLE_CLOCK_SKEW_SECONDS = 10
+# Anyone can send a token with a made-up key id: re-download for an unknown kid at most this often
+GOOGLE_CERTS_UNKNOWN_KID_INTERVAL = int(os.getenv("GOOGLE_CERTS_UNKNOWN_KID_INTERVAL", "60"))
+
+class GoogleCertCache:
+    """Google's signing certificates kept in memory for their Cache-Control max-age"""
+    
+    def __init__(self, url: str):
+        self.url = url
+        self._certs = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._http = None
+        self._refresh_task = None
+        self._next_kid_refresh_at = 0.0
+    
+    @staticmethod
+    def _max_age(cache_control: str) -> int:
+        match = re.search(r"max-age=(\d+)", cache_control or "")
+        return int(match.group(1)) if match else GOOGLE_CERTS_DEFAULT_TTL
+    
+    def _is_stale(self) -> bool:
+        return self._certs is None or time.monotonic() >= self._expires_at
+    
+    def _is_unknown(self, key_id: Optional[str]) -> bool:
+        return bool(key_id and self._certs is not None and key_id not in self._certs)
+    
+    async def refresh(self):
+        """Download the current certificates"""
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(timeout=10)
+        response = await self._http.get(self.url)
+        response.raise_for_status()
+        self._certs = response.json()
+        self._expires_at = time.monotonic() + self._max_age(response.headers.get("cache-control"))
+    
+    async def get_certs(self, key_id: Optional[str] = None) -> dict:
+        """Cached certificates; fetched on first use, expiry or an unknown key id (rotation).
+        Raises ValueError for a key id that is still unknown or was refreshed for too recently."""
+        if self._is_stale():
+            async with self._lock:
+                # Concurrent logins share one download
+                if self._is_stale():
+                    await self.refresh()
+        if self._is_unknown(key_id):
+            # Rejected without touching the lock so forged tokens cannot queue up behind a download
+            if time.monotonic() < self._next_kid_refresh_at:
+                raise ValueError(f"Unknown key id: {key_id}")
+            async with self._lock:
+                if self._is_unknown(key_id) and time.monotonic() >= self._next_kid_refresh_at:
+                    self._next_kid_refresh_at = time.monotonic() + GOOGLE_CERTS_UNKNOWN_KID_INTERVAL
+                    await self.refresh()
+            if self._is_unknown(key_id):
+                raise ValueError(f"Unknown key id: {key_id}")
+        return self._certs
+    
+    async def _refresh_loop(self):
+        while True:
+            delay = max(self._expires_at - time.monotonic() - GOOGLE_CERTS_REFRESH_MARGIN, 0)
+            await asyncio.sleep(delay)
+            try:
+                async with self._lock:
+                    await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing Google certificates: {e}")
+                await asyncio.sleep(30)
+    
+    def start(self):
+        """Keep the certificates warm in the background"""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    async def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+    
+    async def verify(self, token: str, audience: str) -> dict:
+        """Verify a Google ID token; raises ValueError if it is invalid"""
+        from google.auth import jwt as google_jwt
+        header = google_jwt.decode_header(token)
+        certs = await self.get_certs(header.get("kid"))
+        
+        # Signature check is CPU work: keep it off the event loop
+        idinfo = await asyncio.to_thread(
+            google_jwt.decode,
+            token,
+            certs=certs,
+            audience=audience,
+            clock_skew_in_seconds=GOOGLE_CLOCK_SKEW_SECONDS
+        )
+        if idinfo.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer: {idinfo.get('iss')}")
+        return idinfo
+
+google_certs = GoogleCertCache(GOOGLE_CERTS_URL)
+
 # Authentication endpoints
 @app.post("/register", response_model=Token)
 async def register(user_data: UserCreate):
@@ -333,7 +2062,7 @@ async def register(user_data: UserCreate):
             )
         
         # Create user
-        user = create_user(user_data)
+        user = await create_user(user_data)
         
         # Create access token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -360,7 +2089,7 @@ async def register(user_data: UserCreate):
 @app.post("/login", response_model=Token)
 async def login(user_data: UserLogin):
     """Login user"""
-    user = authenticate_user(user_data.email, user_data.password)
+    user = await authenticate_user(user_data.email, user_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -415,12 +2144,8 @@ async def google_auth(google_data: GoogleAuthRequest):
                 detail="Google OAuth not configured. Please contact administrator."
             )
         
-        # Verify the token
-        idinfo = id_token.verify_oauth2_token(
-            google_data.credential, 
-            google_requests.Request(), 
-            GOOGLE_CLIENT_ID
-        )
+        # Verify the token against the cached Google certificates
+        idinfo = await google_certs.verify(google_data.credential, GOOGLE_CLIENT_ID)
         
         # Extract user information from Google
         google_user_id = idinfo['sub']
@@ -444,7 +2169,7 @@ async def google_auth(google_data: GoogleAuthRequest):
                 full_name=name,
                 password=f"google_oauth_{google_user_id}"  # Random password for Google users
             )
-            user = create_user(user_data)
+            user = await create_user(user_data)
             if not user:
                 raise HTTPException(
                     status_code=400,
@@ -452,14 +2177,8 @@ async def google_auth(google_data: GoogleAuthRequest):
                 )
         
         # Update last login
-        conn = sqlite3.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE users SET last_login = ? WHERE id = ?",
-            (datetime.utcnow().isoformat(), user["id"])
-        )
-        conn.commit()
-        conn.close()
+        last_login_cache.set(user["email"], True)
+        write_queue.submit(write_last_login, user["email"])
         
         # Create access token
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -481,6 +2200,8 @@ async def google_auth(google_data: GoogleAuthRequest):
             "user_info": user_info
         }
         
+    except HTTPException:
+        raise
     except ValueError as e:
         # Invalid token
         raise HTTPException(
@@ -500,132 +2221,692 @@ async def logout():
 
 # Page routes
 @app.get("/")
-async def read_root():
+async def read_root(request: Request):
     """Serve the landing page"""
-    from fastapi.responses import FileResponse
-    return FileResponse("index.html")
+    return static_bundle.page("index.html", request)
 
 @app.get("/login-page")
-async def login_page():
+async def login_page(request: Request):
     """Serve the login page"""
-    from fastapi.responses import FileResponse
-    return FileResponse("static/login.html")
+    return static_bundle.page("static/login.html", request)
 
 @app.get("/register-page")
-async def register_page():
+async def register_page(request: Request):
     """Serve the register page"""
-    from fastapi.responses import FileResponse
-    return FileResponse("static/register.html")
+    return static_bundle.page("static/register.html", request)
 
 @app.get("/chat")
-async def chat_page():
+async def chat_page(request: Request):
     """Serve the chatbot page"""
-    from fastapi.responses import FileResponse
-    return FileResponse("static/index.html")
+    return static_bundle.page("static/index.html", request)
 
 @app.get("/app")
-async def app_page():
+async def app_page(request: Request):
     """Serve the chatbot page (alternative route)"""
-    from fastapi.responses import FileResponse
-    return FileResponse("static/index.html")
+    return static_bundle.page("static/index.html", request)
 
 @app.get("/pricing")
-async def pricing_page():
+async def pricing_page(request: Request):
     """Serve the pricing page"""
-    from fastapi.responses import FileResponse
-    return FileResponse("static/pricing.html")
+    return static_bundle.page("static/pricing.html", request)
 
 @app.get("/test")
-async def test_page():
+async def test_page(request: Request):
     """Serve the test features page"""
-    from fastapi.responses import FileResponse
-    return FileResponse("test_ui.html")
+    return static_bundle.page("test_ui.html", request)
 
 # Protected chat endpoints (require authentication)
 @app.post("/chat")
 async def chat_with_ai(
+    http_request: Request,
     request: ChatRequest = None,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(rate_limited_user)
 ):
     """Handle text-only chat requests with OpenAI (Protected)"""
     if request:
+        if wants_event_stream(http_request):
+            return await stream_chat_message(request.message, [], current_user)
         return await process_chat_message(request.message, [], current_user)
     else:
         return {"response": "Xabar topilmadi. Iltimos, xabar yuboring."}
 
+@app.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    current_user: dict = Depends(rate_limited_user)
+):
+    """Stream chat answers token by token as Server-Sent Events (Protected)"""
+    return await stream_chat_message(request.message, [], current_user)
+
+# Streaming upload handling: the multipart body is parsed chunk by chunk, sizes are
+# enforced while reading and file contents are spooled to disk past a small threshold
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "5"))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_FIELD_BYTES = 64 * 1024
+# Whole request body, per subscription plan
+PLAN_UPLOAD_LIMITS = {
+    "free": int(os.getenv("UPLOAD_FREE_MAX_REQUEST_BYTES", str(5 * 1024 * 1024))),
+    "premium": int(os.getenv("UPLOAD_PREMIUM_MAX_REQUEST_BYTES", str(25 * 1024 * 1024))),
+}
+
+class ChatUpload:
+    """An uploaded file that has been fully received: metadata, content hash and spooled content"""
+    
+    def __init__(self, filename: str, content_type: str):
+        self.filename = filename
+        self.content_type = content_type
+        self.size = 0
+        self.file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        self._hash = hashlib.sha256()
+    
+    def write(self, data: bytes):
+        self.size += len(data)
+        self._hash.update(data)
+        self.file.write(data)
+    
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+    
+    def close(self):
+        self.file.close()
+
+def upload_too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+
+async def receive_chat_upload(request: Request, current_user: dict):
+    """Stream-parse a multipart chat upload into (message, uploads), enforcing size limits as bytes arrive"""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Fayllar multipart/form-data ko'rinishida yuborilishi kerak")
+    
+    plan = current_user.get("subscription_plan") or "free"
+    request_limit = PLAN_UPLOAD_LIMITS.get(plan, PLAN_UPLOAD_LIMITS["free"])
+    too_large_request = f"So'rov hajmi {request_limit // (1024 * 1024)} MB dan oshmasligi kerak"
+    
+    # Refuse early when the client announces an oversized body
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > request_limit:
+        raise upload_too_large(too_large_request)
+    
+    fields = {}
+    uploads = []
+    part = {}
+    
+    def on_part_begin():
+        part.clear()
+        part.update(headers={}, header_field=b"", header_value=b"", upload=None, field=None, value=b"")
+    
+    def on_header_field(data, start, end):
+        part["header_field"] += data[start:end]
+    
+    def on_header_value(data, start, end):
+        part["header_value"] += data[start:end]
+    
+    def on_header_end():
+        part["headers"][part["header_field"].lower()] = part["header_value"]
+        part["header_field"] = part["header_value"] = b""
+    
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        name = disposition.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in disposition:
+            filename = disposition[b"filename"].decode("utf-8", "replace")
+            if not filename:
+                return  # Empty file input
+            if len(uploads) >= UPLOAD_MAX_FILES:
+                raise upload_too_large(f"Bir so'rovda ko'pi bilan {UPLOAD_MAX_FILES} ta fayl yuborish mumkin")
+            file_type = part["headers"].get(b"content-type", b"application/octet-stream").decode("latin-1")
+            part["upload"] = ChatUpload(filename, file_type)
+            uploads.append(part["upload"])
+        else:
+            part["field"] = name
+    
+    def on_part_data(data, start, end):
+        chunk = data[start:end]
+        upload = part.get("upload")
+        if upload is not None:
+            if upload.size + len(chunk) > UPLOAD_MAX_FILE_BYTES:
+                raise upload_too_large(
+                    f"{upload.filename}: fayl hajmi {UPLOAD_MAX_FILE_BYTES // (1024 * 1024)} MB dan oshmasligi kerak"
+                )
+            upload.write(chunk)
+        elif part.get("field") is not None:
+            if len(part["value"]) + len(chunk) > UPLOAD_MAX_FIELD_BYTES:
+                raise upload_too_large("Xabar juda uzun")
+            part["value"] += chunk
+    
+    def on_part_end():
+        if part.get("field") is not None:
+            fields[part["field"]] = part["value"].decode("utf-8", "replace")
+    
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > request_limit:
+                raise upload_too_large(too_large_request)
+            parser.write(chunk)
+        parser.finalize()
+    except Exception:
+        for upload in uploads:
+            upload.close()
+        raise
+    
+    if "message" not in fields:
+        for upload in uploads:
+            upload.close()
+        raise HTTPException(status_code=422, detail="Xabar maydoni talab qilinadi")
+    
+    for upload in uploads:
+        upload.file.seek(0)
+    return fields["message"], uploads
+
 @app.post("/chat-with-files", response_model=ChatResponse)
 async def chat_with_files(
-    message: str = Form(...),
-    files: List[UploadFile] = File(default=[]),
-    current_user: dict = Depends(get_current_user)
+    http_request: Request,
+    current_user: dict = Depends(rate_limited_user)
 ):
     """Handle chat requests with file uploads (Protected)"""
-    return await process_chat_message(message, files, current_user)
+    # Parsed here rather than by Form/File params so limits apply after auth and before buffering
+    message, uploads = await receive_chat_upload(http_request, current_user)
+    try:
+        if wants_event_stream(http_request):
+            return await stream_chat_message(message, uploads, current_user)
+        return await process_chat_message(message, uploads, current_user)
+    finally:
+        # Only metadata reaches the prompt, which is built before a streamed response starts
+        for upload in uploads:
+            upload.close()
+
+# Chat completion settings shared by the JSON and streaming chat paths
+CHAT_COMPLETION_PARAMS = {
+    "max_tokens": 800,  # Increased for detailed educational responses
+    "temperature": 0.3,  # Lower temperature for consistent educational tone
+    "top_p": 0.9,       # Focused but creative responses
+    "frequency_penalty": 0.1,  # Avoid repetition
+    "presence_penalty": 0.1    # Encourage diverse vocabulary
+}
+
+SERVICE_UNAVAILABLE_MESSAGE = "Kechirasiz, hozircha xizmat ishlamayapti. Iltimos, keyinroq qayta urinib ko'ring."
+EMPTY_MESSAGE_RESPONSE = "Xabar topilmadi. Iltimos, xabar yuboring."
+EMPTY_ANSWER_RESPONSE = "Kechirasiz, javob yasay olmadim. Savolingizni boshqacha tarzda bering."
+
+# Friendly error messages in Uzbek
+CHAT_ERROR_MESSAGES = [
+    "Kechirasiz, hozirda texnik nosozlik. Bir oz kutib, qayta urinib ko'ring.",
+    "Xatolik yuz berdi. Iltimos, qaytadan harakat qiling.",
+    "Hozircha xizmat ishlamayapti. Keyinroq qayta urinib ko'ring."
+]
+UPSTREAM_TIMEOUT_MESSAGE = "Kechirasiz, javob tayyorlash juda uzoq cho'zildi. Iltimos, qayta urinib ko'ring."
+UPSTREAM_UNAVAILABLE_MESSAGE = "AI xizmati vaqtincha ishlamayapti. Bir necha daqiqadan so'ng qayta urinib ko'ring."
+UPSTREAM_BUSY_MESSAGE = "Hozir so'rovlar juda ko'p. Iltimos, biroz kutib qayta urinib ko'ring."
+
+def chat_error_message(error: Exception) -> str:
+    """User-facing message for a failed chat completion"""
+    if isinstance(error, UpstreamTimeout):
+        return UPSTREAM_TIMEOUT_MESSAGE
+    if isinstance(error, UpstreamUnavailable):
+        return UPSTREAM_UNAVAILABLE_MESSAGE
+    if is_rate_limited(error):
+        return UPSTREAM_BUSY_MESSAGE
+    return random.choice(CHAT_ERROR_MESSAGES)
+
+def wants_event_stream(request: Request) -> bool:
+    """Check whether the client asked for a Server-Sent Events response"""
+    return "text/event-stream" in request.headers.get("accept", "")
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format a single Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# Conversation context: recent turns of the active session within a token budget,
+# older turns folded into a per-session rolling summary
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+CHAT_CONTEXT_MAX_TURNS = int(os.getenv("CHAT_CONTEXT_MAX_TURNS", "10"))
+CHAT_SESSION_IDLE_MINUTES = int(os.getenv("CHAT_SESSION_IDLE_MINUTES", "120"))
+CHAT_SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", "20"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+CHAT_SESSION_IDLE_WINDOW = f"-{CHAT_SESSION_IDLE_MINUTES} minutes"
+
+SUMMARY_PROMPT = """Siz o'quvchi va Aspiro AI o'qituvchisi o'rtasidagi suhbat xulosasini yuritasiz.
+Avvalgi xulosani yangi suhbat qismlari bilan birlashtirib, bitta qisqa xulosa yozing:
+o'quvchi nimani o'rganayotgani, qaysi mavzular tushuntirilgani, qayerda qiynalgani va
+qanday kelishuvlar bo'lgani. Faqat xulosa matnini qaytaring, o'zbek tilida, 150 so'zdan oshirmang."""
+
+summary_tasks = {}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token), good enough for budgeting"""
+    return len(text) // 4 + 1
+
+def load_conversation_context(user_id: int) -> Optional[dict]:
+    """Active session summary and the newest unsummarized turns that fit the token budget"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, summary, summary_upto_id FROM chat_sessions
+            WHERE user_id = ? AND updated_at >= datetime('now', ?)
+            ORDER BY updated_at DESC
+            LIMIT 1
+        """, (user_id, CHAT_SESSION_IDLE_WINDOW))
+        session = cursor.fetchone()
+        if not session:
+            return None
+        
+        session_id, summary, summary_upto_id = session
+        # One extra row tells whether older unsummarized turns are left behind
+        cursor.execute("""
+            SELECT id, user_message, ai_response FROM chat_messages
+            WHERE session_id = ? AND id > ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (session_id, summary_upto_id, CHAT_CONTEXT_MAX_TURNS + 1))
+        rows = cursor.fetchall()
+    
+    turns = []
+    budget = CHAT_CONTEXT_TOKEN_BUDGET - (estimate_tokens(summary) if summary else 0)
+    for row in rows[:CHAT_CONTEXT_MAX_TURNS]:
+        cost = estimate_tokens(row[1]) + estimate_tokens(row[2])
+        if cost > budget:
+            break
+        budget -= cost
+        turns.append(row)
+    turns.reverse()
+    
+    return {
+        "session_id": session_id,
+        "summary": summary,
+        "summary_upto_id": summary_upto_id,
+        "turns": turns,
+        # Everything older than the first kept turn should be folded into the summary
+        "overflow_before_id": (turns[0][0] if turns else rows[0][0] + 1) if len(turns) < len(rows) else None
+    }
+
+def schedule_summary_update(context: dict):
+    """Fold turns that fell out of the context window into the session summary, off the request path"""
+    session_id = context["session_id"]
+    if context["overflow_before_id"] is None or session_id in summary_tasks:
+        return
+    task = asyncio.create_task(update_session_summary(
+        session_id, context["summary"], context["summary_upto_id"], context["overflow_before_id"]
+    ))
+    summary_tasks[session_id] = task
+    task.add_done_callback(lambda _: summary_tasks.pop(session_id, None))
+
+async def update_session_summary(session_id: int, summary: Optional[str], summary_upto_id: int, before_id: int):
+    """Summarize the oldest unsummarized turns (one batch) into the rolling summary"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, user_message, ai_response FROM chat_messages
+                WHERE session_id = ? AND id > ? AND id < ?
+                ORDER BY id
+                LIMIT ?
+            """, (session_id, summary_upto_id, before_id, CHAT_SUMMARY_BATCH_TURNS))
+            rows = cursor.fetchall()
+        if not rows:
+            return
+        
+        transcript = "\n\n".join(f"O'quvchi: {row[1]}\nAspiro AI: {row[2]}" for row in rows)
+        response = await llm_chat(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Avvalgi xulosa:\n{summary or '-'}\n\nYangi suhbat qismlari:\n{transcript}"}
+            ],
+            max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+            temperature=0.2
+        )
+        new_summary = (response.choices[0].message.content or "").strip()
+        if new_summary:
+            write_queue.submit(write_session_summary, session_id, new_summary, summary_upto_id, rows[-1][0])
+    except Exception as e:
+        print(f"Error updating summary for session {session_id}: {str(e)}")
+
+def write_session_summary(cursor: sqlite3.Cursor, session_id: int, summary: str, previous_upto_id: int, upto_id: int):
+    """Store a rolling summary unless another update already advanced it"""
+    cursor.execute("""
+        UPDATE chat_sessions
+        SET summary = ?, summary_upto_id = ?
+        WHERE id = ? AND summary_upto_id = ?
+    """, (summary, upto_id, session_id, previous_upto_id))
+
+def context_messages(context: Optional[dict]) -> List[dict]:
+    """Render a loaded conversation context as chat messages"""
+    if not context:
+        return []
+    messages = []
+    if context["summary"]:
+        messages.append({"role": "system", "content": f"Suhbatning avvalgi qismi xulosasi: {context['summary']}"})
+    for _, user_message, ai_response in context["turns"]:
+        messages.append({"role": "user", "content": user_message})
+        messages.append({"role": "assistant", "content": ai_response})
+    return messages
+
+# Near-duplicate question cache: standalone questions that match an earlier one closely enough
+# (character-shingle MinHash with LSH banding, verified by exact Jaccard, an exact match of numbers and
+# operators and a word-level Jaccard that tolerates inflected forms) reuse its answer
+NEAR_DUP_CACHE = os.getenv("NEAR_DUP_CACHE", "1") == "1"
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.7"))  # Jaccard similarity of the question shingles
+NEAR_DUP_WORD_THRESHOLD = float(os.getenv("NEAR_DUP_WORD_THRESHOLD", "0.8"))  # Jaccard similarity of the content words
+NEAR_DUP_MAX_ENTRIES = int(os.getenv("NEAR_DUP_MAX_ENTRIES", "50000"))  # Oldest entries are dropped first
+NEAR_DUP_MIN_CHARS = int(os.getenv("NEAR_DUP_MIN_CHARS", "12"))  # Shorter questions are too vague to match
+NEAR_DUP_REFRESH_SECONDS = int(os.getenv("NEAR_DUP_REFRESH_SECONDS", "300"))  # Pick up answers from other workers
+SHINGLE_SIZE = 4
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16  # 16 bands x 4 rows: pairs at 0.7 similarity become candidates ~99% of the time
+MINHASH_PRIME = (1 << 61) - 1
+MINHASH_COEFFICIENTS = [
+    (rng.randrange(1, MINHASH_PRIME), rng.randrange(MINHASH_PRIME))
+    for rng in [random.Random(20240917)]
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+# Words that change how a question is phrased but not what it asks (Latin Uzbek after normalization, English)
+QUESTION_FILLER_WORDS = {
+    "nima", "nimadir", "haqida", "tushuntir", "tushuntiring", "tushuntirib", "tushuntirib ber", "ber", "bering",
+    "ayt", "ayting", "aytib", "aytchi", "iltimos", "menga", "bilasanmi", "bilasizmi", "degani", "deganda",
+    "qisqacha", "batafsil", "haqidagi", "nedir", "what", "is", "the", "a", "an", "please", "explain", "tell", "me",
+    "about",
+}
+
+def question_shingles(text: str) -> frozenset:
+    """Hashed character shingles of a question with script, case, punctuation and filler words normalized away"""
+    words = re.sub(r"[^\w']+", " ", normalize_cache_text(text)).split()
+    core = " ".join(word for word in words if word not in QUESTION_FILLER_WORDS)
+    if len(core) < NEAR_DUP_MIN_CHARS:
+        return frozenset()
+    return frozenset(hash(core[i:i + SHINGLE_SIZE]) for i in range(len(core) - SHINGLE_SIZE + 1))
+
+def question_signature(text: str) -> tuple:
+    """Numbers and math operators in order (must match exactly) and the content words (must match loosely)"""
+    normalized = normalize_cache_text(text)
+    numbers = tuple(re.findall(r"\d+(?:[.,]\d+)?", normalized))
+    operators = "".join(re.findall(r"[-+*/=^<>%]", normalized))
+    words = frozenset(word for word in re.sub(r"[^\w']+", " ", normalized).split() if word not in QUESTION_FILLER_WORDS)
+    return numbers, operators, words
+
+def words_match(first: str, second: str) -> bool:
+    """Same word up to an inflected ending ("teoremasi", "teoremasini", "teoremani"); "go" and "do" differ"""
+    if first == second:
+        return True
+    shorter, longer = sorted((first, second), key=len)
+    if len(shorter) >= 4 and longer.startswith(shorter):
+        return True
+    common = len(os.path.commonprefix((first, second)))
+    return common >= max(5, len(shorter) - 2)
+
+def word_similarity(first: frozenset, second: frozenset) -> float:
+    """Jaccard similarity of two content-word sets, counting inflected forms of a word as the same word"""
+    if not first and not second:
+        return 1.0
+    matched = min(
+        sum(1 for word in first if any(words_match(word, other) for other in second)),
+        sum(1 for word in second if any(words_match(word, other) for other in first))
+    )
+    return matched / (len(first) + len(second) - matched)
+
+def lsh_band_keys(shingles: frozenset) -> list:
+    """MinHash signature of the shingles, cut into LSH band keys"""
+    signature = [min((a * x + b) % MINHASH_PRIME for x in shingles) for a, b in MINHASH_COEFFICIENTS]
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    return [(band, hash(tuple(signature[band * rows:(band + 1) * rows]))) for band in range(LSH_BANDS)]
+
+class NearDuplicateIndex:
+    """In-process MinHash/LSH index of standalone chat questions and their answers (per worker)"""
+    
+    def __init__(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # entry_id -> (shingles, band keys, signature, answer), oldest first
+        self._buckets = {}  # band key -> set of entry_ids
+        self._next_id = 0
+        self.last_message_id = 0  # Highest chat_messages.id already considered
+        self.ready = False
+        self._refresh_task = None
+        self.stats = {"lookups": 0, "hits": 0, "added": 0, "duplicates_skipped": 0}
+        self._lookup_seconds = 0.0
+        self._max_lookup_seconds = 0.0
+    
+    def _best_match(self, shingles: frozenset, band_keys: list, signature: tuple) -> tuple:
+        """(answer, similarity) of the most similar indexed question with matching numbers and words, or (None, 0.0)"""
+        candidates = set()
+        for key in band_keys:
+            candidates.update(self._buckets.get(key, ()))
+        best_answer, best_similarity = None, 0.0
+        for entry_id in candidates:
+            entry_shingles, _, entry_signature, answer = self._entries[entry_id]
+            # Similar wording is not enough: "12 ning kvadrati" must not answer "13 ning kvadrati",
+            # and "past tense of go" must not answer "past tense of do"
+            if entry_signature[:2] != signature[:2]:
+                continue
+            if word_similarity(signature[2], entry_signature[2]) < NEAR_DUP_WORD_THRESHOLD:
+                continue
+            similarity = len(shingles & entry_shingles) / len(shingles | entry_shingles)
+            if similarity > best_similarity:
+                best_answer, best_similarity = answer, similarity
+        return best_answer, best_similarity
+    
+    def lookup(self, question: str) -> Optional[str]:
+        """Answer of a near-identical earlier question, if one is at or above the threshold"""
+        started = time.perf_counter()
+        shingles = question_shingles(question)
+        answer, similarity = (
+            self._best_match(shingles, lsh_band_keys(shingles), question_signature(question)) if shingles else (None, 0.0)
+        )
+        elapsed = time.perf_counter() - started
+        
+        self.stats["lookups"] += 1
+        self._lookup_seconds += elapsed
+        self._max_lookup_seconds = max(self._max_lookup_seconds, elapsed)
+        chat_near_dup_lookup.observe(elapsed)
+        if answer is not None and similarity >= self.threshold:
+            self.stats["hits"] += 1
+            chat_near_dup_total.inc(outcome="hit")
+            return answer
+        chat_near_dup_total.inc(outcome="miss")
+        return None
+    
+    def add(self, shingles: frozenset, band_keys: list, signature: tuple, answer: str):
+        """Index a question unless a near-identical one is already there"""
+        if not shingles:
+            return
+        if self._best_match(shingles, band_keys, signature)[1] >= self.threshold:
+            self.stats["duplicates_skipped"] += 1
+            return
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = (shingles, band_keys, signature, answer)
+        for key in band_keys:
+            self._buckets.setdefault(key, set()).add(entry_id)
+        self.stats["added"] += 1
+        
+        while len(self._entries) > self.max_entries:
+            old_id, (_, old_keys, _, _) = self._entries.popitem(last=False)
+            for key in old_keys:
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(old_id)
+                    if not bucket:
+                        del self._buckets[key]
+    
+    def remember(self, question: str, answer: str):
+        """Index a freshly generated answer (called on the event loop)"""
+        shingles = question_shingles(question)
+        if shingles:
+            self.add(shingles, lsh_band_keys(shingles), question_signature(question), answer)
+    
+    async def refresh(self):
+        """Index first-turn exchanges written since the last refresh (by any worker)"""
+        prepared, last_id = await asyncio.to_thread(prepare_near_dup_entries, self.last_message_id, self.max_entries)
+        for index, (shingles, band_keys, signature, answer) in enumerate(prepared):
+            self.add(shingles, band_keys, signature, answer)
+            if index % 500 == 499:
+                await asyncio.sleep(0)  # Long rebuilds must not stall requests
+        self.last_message_id = max(self.last_message_id, last_id)
+        self.ready = True
+    
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing near-duplicate index: {str(e)}")
+            await asyncio.sleep(NEAR_DUP_REFRESH_SECONDS)
+    
+    def start(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+    
+    def snapshot(self) -> dict:
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "ready": self.ready,
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "avg_lookup_ms": round(self._lookup_seconds / lookups * 1000, 3) if lookups else 0.0,
+            "max_lookup_ms": round(self._max_lookup_seconds * 1000, 3)
+        }
+
+def is_personalized(answer: str, full_name: Optional[str]) -> bool:
+    """Whether an answer addresses its asker by name (then it must not be served to others)"""
+    first_name = normalize_cache_text((full_name or "").split(" ")[0]) if full_name else ""
+    return len(first_name) >= 3 and first_name in normalize_cache_text(answer)
+
+def prepare_near_dup_entries(after_id: int, limit: int) -> tuple:
+    """Shingles, band keys and signatures for new first-turn exchanges; runs in a worker thread"""
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        # The first message of a session was answered without conversation context, so it stands alone
+        cursor.execute("""
+            SELECT m.id, m.user_message, m.ai_response, u.full_name
+            FROM chat_messages m
+            JOIN chat_sessions s ON s.id = m.session_id
+            JOIN users u ON u.id = s.user_id
+            WHERE m.id > ?
+              AND m.id = (SELECT MIN(first.id) FROM chat_messages first WHERE first.session_id = m.session_id)
+            ORDER BY m.id DESC
+            LIMIT ?
+        """, (after_id, limit))
+        rows = cursor.fetchall()
+    
+    prepared = []
+    for _, question, answer, full_name in reversed(rows):
+        if not answer or is_personalized(answer, full_name):
+            continue
+        shingles = question_shingles(question)
+        if shingles:
+            prepared.append((shingles, lsh_band_keys(shingles), question_signature(question), answer))
+    return prepared, (rows[0][0] if rows else after_id)
+
+near_dup_index = NearDuplicateIndex(NEAR_DUP_THRESHOLD, NEAR_DUP_MAX_ENTRIES)
+
+def is_standalone_question(files: List[ChatUpload], messages: List[dict]) -> bool:
+    """Only questions without attachments or earlier turns (system prompt + question) can share answers"""
+    return NEAR_DUP_CACHE and not files and len(messages) == 2
+
+def near_duplicate_answer(user_message: str, files: List[ChatUpload], messages: List[dict]) -> Optional[str]:
+    """Answer to a near-identical earlier standalone question, if the index has one"""
+    if not is_standalone_question(files, messages):
+        chat_near_dup_total.inc(outcome="skipped")
+        return None
+    return near_dup_index.lookup(user_message)
+
+def remember_chat_answer(user_message: str, files: List[ChatUpload], messages: List[dict], ai_response: str,
+                         current_user: dict):
+    """Add a newly generated standalone answer to the near-duplicate index"""
+    if is_standalone_question(files, messages) and not is_personalized(ai_response, current_user.get("full_name")):
+        near_dup_index.remember(user_message, ai_response)
+
+async def build_chat_messages(user_message: str, files: List[ChatUpload], current_user: dict) -> List[dict]:
+    """Build the completion prompt for a chat message (file notes + user context)"""
+    # Process uploaded files if any
+    file_descriptions = []
+    if files and len(files) > 0:
+        for file in files:
+            if file.filename:  # Check if file is actually uploaded
+                # Size was counted while the upload streamed in
+                file_size = file.size
+                
+                if file.content_type.startswith('image/'):
+                    # For images, describe what we received
+                    file_descriptions.append(f"Rasm fayli: {file.filename} ({file_size} bayt)")
+                elif file.content_type.startswith('audio/'):
+                    # For audio files, describe what we received
+                    file_descriptions.append(f"Audio fayli: {file.filename} ({file_size} bayt)")
+                else:
+                    # For other files, just note the file
+                    file_descriptions.append(f"Fayl: {file.filename} ({file_size} bayt)")
+    
+    # Enhance message with file information and user context
+    enhanced_message = user_message
+    if file_descriptions:
+        enhanced_message += f"\n\nQo'shimcha ma'lumot: Foydalanuvchi quyidagi fayllarni yukladi:\n" + "\n".join(file_descriptions)
+        enhanced_message += "\n\nIltimos, yuklangan fayllar haqida ma'lumot bering yoki ular bilan bog'liq savolga javob bering."
+    
+    # Add user context to system prompt
+    user_context = f"\n\nFoydalanuvchi ma'lumotlari: {current_user['full_name']} ({current_user['subscription_plan']} rejasi)"
+    
+    # Earlier turns of the active session, bounded by CHAT_CONTEXT_TOKEN_BUDGET
+    context = load_conversation_context(current_user["id"])
+    if context:
+        schedule_summary_update(context)
+    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + user_context},
+        *context_messages(context),
+        {"role": "user", "content": enhanced_message}
+    ]
 
-async def process_chat_message(user_message: str, files: List[UploadFile], current_user: dict):
+async def process_chat_message(user_message: str, files: List[ChatUpload], current_user: dict):
     """Process chat message with optional files (now includes user context)"""
     try:
-        if not client.api_key:
-            return ChatResponse(response="Kechirasiz, hozircha xizmat ishlamayapti. Iltimos, keyinroq qayta urinib ko'ring.")
+        if not OPENAI_API_KEY:
+            return ChatResponse(response=SERVICE_UNAVAILABLE_MESSAGE)
         
         # Validate message
         if not user_message:
-            return ChatResponse(response="Xabar topilmadi. Iltimos, xabar yuboring.")
-        
-        # Check subscription limits (basic implementation)
-        if current_user["subscription_plan"] == "free":
-            # Add usage tracking here if needed
-            pass
-        
-        # Process uploaded files if any
-        file_descriptions = []
-        if files and len(files) > 0:
-            for file in files:
-                if file.filename:  # Check if file is actually uploaded
-                    file_content = await file.read()
-                    file_size = len(file_content)
-                    
-                    if file.content_type.startswith('image/'):
-                        # For images, describe what we received
-                        file_descriptions.append(f"Rasm fayli: {file.filename} ({file_size} bayt)")
-                    elif file.content_type.startswith('audio/'):
-                        # For audio files, describe what we received
-                        file_descriptions.append(f"Audio fayli: {file.filename} ({file_size} bayt)")
-                    else:
-                        # For other files, just note the file
-                        file_descriptions.append(f"Fayl: {file.filename} ({file_size} bayt)")
-        
-        # Enhance message with file information and user context
-        enhanced_message = user_message
-        if file_descriptions:
-            enhanced_message += f"\n\nQo'shimcha ma'lumot: Foydalanuvchi quyidagi fayllarni yukladi:\n" + "\n".join(file_descriptions)
-            enhanced_message += "\n\nIltimos, yuklangan fayllar haqida ma'lumot bering yoki ular bilan bog'liq savolga javob bering."
-        
-        # Add user context to system prompt
-        user_context = f"\n\nFoydalanuvchi ma'lumotlari: {current_user['full_name']} ({current_user['subscription_plan']} rejasi)"
+            return ChatResponse(response=EMPTY_MESSAGE_RESPONSE)
+        
+        messages = await build_chat_messages(user_message, files, current_user)
+        
+        # A student asked nearly the same standalone question before
+        cached_answer = near_duplicate_answer(user_message, files, messages)
+        if cached_answer is not None:
+            save_chat_to_history(current_user["id"], user_message, cached_answer)
+            return ChatResponse(response=cached_answer)
         
         # Create chat completion with optimized settings
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Using GPT-4o-mini for better performance and cost
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT + user_context},
-                {"role": "user", "content": enhanced_message}
-            ],
-            max_tokens=800,  # Increased for detailed educational responses
-            temperature=0.3,  # Lower temperature for consistent educational tone
-            top_p=0.9,       # Focused but creative responses
-            frequency_penalty=0.1,  # Avoid repetition
-            presence_penalty=0.1    # Encourage diverse vocabulary
-        )
+        response = await llm_chat(messages=messages, **CHAT_COMPLETION_PARAMS)
         
         ai_response = response.choices[0].message.content
         
         # Ensure response is not empty
         if not ai_response or ai_response.strip() == "":
-            return ChatResponse(response="Kechirasiz, javob yasay olmadim. Savolingizni boshqacha tarzda bering.")
+            return ChatResponse(response=EMPTY_ANSWER_RESPONSE)
         
         # Save chat to user's history (optional)
         save_chat_to_history(current_user["id"], user_message, ai_response)
+        remember_chat_answer(user_message, files, messages, ai_response, current_user)
         
         return ChatResponse(response=ai_response)
         
@@ -633,79 +2914,181 @@ async def process_chat_message(user_message: str, files: List[UploadFile], curre
         # Log the actual error for debugging
         print(f"Error in process_chat_message: {str(e)}")
         print(f"Error type: {type(e).__name__}")
+        errors_total.inc(type=type(e).__name__, where="chat")
         
-        # Friendly error message in Uzbek
-        error_messages = [
-            "Kechirasiz, hozirda texnik nosozlik. Bir oz kutib, qayta urinib ko'ring.",
-            "Xatolik yuz berdi. Iltimos, qaytadan harakat qiling.",
-            "Hozircha xizmat ishlamayapti. Keyinroq qayta urinib ko'ring."
-        ]
-        
-        import random
-        return ChatResponse(response=random.choice(error_messages))
+        return ChatResponse(response=chat_error_message(e))
+
+async def stream_chat_message(user_message: str, files: List[ChatUpload], current_user: dict):
+    """Stream a chat answer as Server-Sent Events, saving the full answer once it ends"""
+    if not OPENAI_API_KEY:
+        return StreamingResponse(iter([sse_event({"error": SERVICE_UNAVAILABLE_MESSAGE}, event="error")]),
+                                 media_type="text/event-stream")
+    
+    if not user_message:
+        return StreamingResponse(iter([sse_event({"response": EMPTY_MESSAGE_RESPONSE}, event="done")]),
+                                 media_type="text/event-stream")
+    
+    # Build the prompt before the response starts; the uploads are closed once the endpoint returns
+    messages = await build_chat_messages(user_message, files, current_user)
+    cached_answer = near_duplicate_answer(user_message, files, messages)
+    
+    async def event_stream():
+        if cached_answer is not None:
+            save_chat_to_history(current_user["id"], user_message, cached_answer)
+            yield sse_event({"delta": cached_answer})
+            yield sse_event({"response": cached_answer}, event="done")
+            return
+        
+        parts = []
+        try:
+            async for delta in llm_chat_stream(messages=messages, **CHAT_COMPLETION_PARAMS):
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+        except Exception as e:
+            print(f"Error in stream_chat_message: {str(e)}")
+            print(f"Error type: {type(e).__name__}")
+            errors_total.inc(type=type(e).__name__, where="chat")
+            yield sse_event({"error": chat_error_message(e)}, event="error")
+            return
+        
+        ai_response = "".join(parts)
+        if not ai_response.strip():
+            yield sse_event({"response": EMPTY_ANSWER_RESPONSE}, event="done")
+            return
+        
+        # Persist the fully assembled answer, same as the JSON path
+        save_chat_to_history(current_user["id"], user_message, ai_response)
+        remember_chat_answer(user_message, files, messages, ai_response, current_user)
+        yield sse_event({"response": ai_response}, event="done")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 def save_chat_to_history(user_id: int, user_message: str, ai_response: str):
-    """Save chat to user's history"""
-    try:
-        conn = sqlite3.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        
-        # Get or create current session
+    """Save chat to user's history (applied by the write-behind queue)"""
+    write_queue.submit(write_chat_history, user_id, user_message, ai_response)
+
+def write_chat_history(cursor: sqlite3.Cursor, user_id: int, user_message: str, ai_response: str):
+    """Write one chat exchange into the user's current session"""
+    # Get or create current session
+    cursor.execute("""
+        SELECT id FROM chat_sessions 
+        WHERE user_id = ? AND updated_at >= datetime('now', ?)
+        ORDER BY updated_at DESC 
+        LIMIT 1
+    """, (user_id, CHAT_SESSION_IDLE_WINDOW))
+    
+    session = cursor.fetchone()
+    
+    new_chats = 0
+    if not session:
+        # Create new session
         cursor.execute("""
-            SELECT id FROM chat_sessions 
-            WHERE user_id = ? 
-            ORDER BY updated_at DESC 
-            LIMIT 1
-        """, (user_id,))
-        
-        session = cursor.fetchone()
-        
-        if not session:
-            # Create new session
-            cursor.execute("""
-                INSERT INTO chat_sessions (user_id, session_title) 
-                VALUES (?, ?)
-            """, (user_id, f"Suhbat {datetime.now().strftime('%Y-%m-%d %H:%M')}"))
-            session_id = cursor.lastrowid
-        else:
-            session_id = session[0]
-            # Update session timestamp
-            cursor.execute("""
-                UPDATE chat_sessions 
-                SET updated_at = CURRENT_TIMESTAMP 
-                WHERE id = ?
-            """, (session_id,))
-        
-        # Save message
+            INSERT INTO chat_sessions (user_id, session_title, message_count) 
+            VALUES (?, ?, 1)
+        """, (user_id, f"Suhbat {datetime.now().strftime('%Y-%m-%d %H:%M')}"))
+        session_id = cursor.lastrowid
+        new_chats = 1
+    else:
+        session_id = session[0]
+        # Update session timestamp and message counter
         cursor.execute("""
-            INSERT INTO chat_messages (session_id, user_message, ai_response) 
-            VALUES (?, ?, ?)
-        """, (session_id, user_message, ai_response))
-        
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Error saving chat history: {e}")
+            UPDATE chat_sessions 
+            SET updated_at = CURRENT_TIMESTAMP, message_count = message_count + 1 
+            WHERE id = ?
+        """, (session_id,))
+    
+    # Save message
+    cursor.execute("""
+        INSERT INTO chat_messages (session_id, user_message, ai_response) 
+        VALUES (?, ?, ?)
+    """, (session_id, user_message, ai_response))
+    
+    # Roll the exchange into the user's stats; the streak grows only on the first message of a new day
+    cursor.execute("""
+        INSERT INTO user_daily_activity (user_id, activity_date, message_count)
+        VALUES (?, DATE('now'), 1)
+        ON CONFLICT (user_id, activity_date) DO UPDATE SET message_count = message_count + 1
+    """, (user_id,))
+    cursor.execute("""
+        INSERT INTO user_stats (user_id, total_chats, total_messages, current_streak, last_active_date)
+        VALUES (?, ?, 1, 1, DATE('now'))
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_chats = total_chats + excluded.total_chats,
+            total_messages = total_messages + 1,
+            current_streak = CASE
+                WHEN last_active_date = excluded.last_active_date THEN current_streak
+                WHEN last_active_date = DATE(excluded.last_active_date, '-1 day') THEN current_streak + 1
+                ELSE 1
+            END,
+            last_active_date = excluded.last_active_date
+    """, (user_id, new_chats))
+
+# Chat history pagination
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+def encode_history_cursor(*values) -> str:
+    """Opaque cursor for the last row of a history page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_history_cursor(cursor: str, expected_length: int) -> list:
+    """Decode a cursor produced by encode_history_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        values = None
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise HTTPException(status_code=400, detail="Sahifa kursori noto'g'ri")
+    return values
+
+def history_page_size(limit: Optional[int]) -> int:
+    """Clamp a requested page size"""
+    if limit is None:
+        return HISTORY_PAGE_SIZE
+    return max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
 
 @app.get("/chat-history")
-async def get_chat_history(current_user: dict = Depends(get_current_user)):
-    """Get user's chat history"""
-    conn = sqlite3.connect(DATABASE_URL)
-    cursor = conn.cursor()
+async def get_chat_history(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get user's chat sessions, most recently updated first, one page at a time"""
+    page_size = history_page_size(limit)
     
-    cursor.execute("""
-        SELECT cs.id, cs.session_title, cs.created_at, cs.updated_at,
-               COUNT(cm.id) as message_count
-        FROM chat_sessions cs
-        LEFT JOIN chat_messages cm ON cs.id = cm.session_id
-        WHERE cs.user_id = ?
-        GROUP BY cs.id
-        ORDER BY cs.updated_at DESC
-        LIMIT 50
-    """, (current_user["id"],))
-    
-    sessions = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        db_cursor = conn.cursor()
+        
+        if cursor:
+            updated_at, session_id = decode_history_cursor(cursor, 2)
+            db_cursor.execute("""
+                SELECT id, session_title, created_at, updated_at, message_count
+                FROM chat_sessions
+                WHERE user_id = ? AND (updated_at, id) < (?, ?)
+                ORDER BY updated_at DESC, id DESC
+                LIMIT ?
+            """, (current_user["id"], updated_at, session_id, page_size + 1))
+        else:
+            db_cursor.execute("""
+                SELECT id, session_title, created_at, updated_at, message_count
+                FROM chat_sessions
+                WHERE user_id = ?
+                ORDER BY updated_at DESC, id DESC
+                LIMIT ?
+            """, (current_user["id"], page_size + 1))
+        
+        sessions = db_cursor.fetchall()
+    
+    # One extra row tells whether another page exists
+    next_cursor = None
+    if len(sessions) > page_size:
+        sessions = sessions[:page_size]
+        next_cursor = encode_history_cursor(sessions[-1][3], sessions[-1][0])
     
     return {
         "sessions": [
@@ -717,7 +3100,67 @@ async def get_chat_history(current_user: dict = Depends(get_current_user)):
                 "message_count": session[4]
             }
             for session in sessions
-        ]
+        ],
+        "next_cursor": next_cursor
+    }
+
+@app.get("/chat-history/{session_id}/messages")
+async def get_session_messages(
+    session_id: int,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a session's messages; pages walk backwards from the newest, each page in chronological order"""
+    page_size = history_page_size(limit)
+    
+    with db_connection() as conn:
+        db_cursor = conn.cursor()
+        
+        db_cursor.execute(
+            "SELECT 1 FROM chat_sessions WHERE id = ? AND user_id = ?",
+            (session_id, current_user["id"])
+        )
+        if not db_cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Suhbat topilmadi")
+        
+        if cursor:
+            (before_id,) = decode_history_cursor(cursor, 1)
+            db_cursor.execute("""
+                SELECT id, user_message, ai_response, created_at
+                FROM chat_messages
+                WHERE session_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            """, (session_id, before_id, page_size + 1))
+        else:
+            db_cursor.execute("""
+                SELECT id, user_message, ai_response, created_at
+                FROM chat_messages
+                WHERE session_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            """, (session_id, page_size + 1))
+        
+        messages = db_cursor.fetchall()
+    
+    next_cursor = None
+    if len(messages) > page_size:
+        messages = messages[:page_size]
+        next_cursor = encode_history_cursor(messages[-1][0])
+    
+    return {
+        "session_id": session_id,
+        "messages": [
+            {
+                "id": message[0],
+                "user_message": message[1],
+                "ai_response": message[2],
+                "created_at": message[3]
+            }
+            for message in reversed(messages)
+        ],
+        "next_cursor": next_cursor
     }
 
 @app.get("/health")
@@ -725,16 +3168,15 @@ async def health_check():
     """Health check endpoint for Railway deployment"""
     try:
         # Test database connectivity
-        conn = sqlite3.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.fetchone()
-        conn.close()
+        schema_version = get_schema_version()
         
         return {
             "status": "OK", 
             "service": "Aspiro AI",
             "database": "connected",
+            "schema_version": schema_version,
+            "write_queue": write_queue.snapshot(),
+            "llm_upstream": llm_breaker.snapshot(),  # Informational: an open circuit does not fail the health check
             "timestamp": datetime.utcnow().isoformat()
         }
     except Exception as e:
@@ -748,56 +3190,257 @@ async def health_check():
             "timestamp": datetime.utcnow().isoformat()
         })
 
+USAGE_REPORT_GROUPS = {"period": None, "plan": "plan", "endpoint": "endpoint", "user": "user_id"}
+
+def usage_cost(prompt_tokens: int, completion_tokens: int, cached_tokens: int) -> float:
+    """Estimated USD cost at the configured LLM_MODEL prices"""
+    return round((
+        (prompt_tokens - cached_tokens) * LLM_PRICE_INPUT_PER_MTOK
+        + cached_tokens * LLM_PRICE_CACHED_INPUT_PER_MTOK
+        + completion_tokens * LLM_PRICE_OUTPUT_PER_MTOK
+    ) / 1_000_000, 6)
+
+@app.get("/usage-report")
+async def usage_report(
+    request: Request,
+    granularity: str = "daily",
+    days: int = 7,
+    group_by: str = "plan,endpoint",
+    limit: int = 100
+):
+    """LLM token usage and estimated cost from the hourly/daily rollups (admin token required)"""
+    if not USAGE_REPORT_TOKEN:
+        raise HTTPException(status_code=403, detail="Usage report is disabled; set USAGE_REPORT_TOKEN")
+    if request.headers.get("authorization") != f"Bearer {USAGE_REPORT_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    if granularity not in ("daily", "hourly"):
+        raise HTTPException(status_code=400, detail="granularity must be daily or hourly")
+    table, period = ("llm_usage_daily", "day") if granularity == "daily" else ("llm_usage_hourly", "hour")
+    groups = [group.strip() for group in group_by.split(",") if group.strip()]
+    unknown = [group for group in groups if group not in USAGE_REPORT_GROUPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by: {', '.join(unknown)}")
+    columns = [period if group == "period" else USAGE_REPORT_GROUPS[group] for group in groups]
+    
+    since = datetime.utcnow() - timedelta(days=max(days, 1) - 1)
+    since_key = since.strftime("%Y-%m-%d") if period == "day" else since.strftime("%Y-%m-%d 00:00")
+    totals_sql = "SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), SUM(cached_tokens)"
+    
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {totals_sql} FROM {table} WHERE {period} >= ?", (since_key,))
+        totals = cursor.fetchone()
+        rows = []
+        if columns:
+            cursor.execute(f"""
+                SELECT {", ".join(columns)}, {totals_sql}
+                FROM {table}
+                WHERE {period} >= ?
+                GROUP BY {", ".join(columns)}
+                ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC
+                LIMIT ?
+            """, (since_key, max(1, min(limit, 1000))))
+            rows = cursor.fetchall()
+    
+    def usage_entry(requests_count, prompt_tokens, completion_tokens, cached_tokens) -> dict:
+        prompt_tokens, completion_tokens, cached_tokens = prompt_tokens or 0, completion_tokens or 0, cached_tokens or 0
+        return {
+            "requests": requests_count or 0,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "cost_usd": usage_cost(prompt_tokens, completion_tokens, cached_tokens)
+        }
+    
+    return {
+        "granularity": granularity,
+        "since": since_key,
+        "model": LLM_MODEL,
+        "group_by": groups,
+        "total": usage_entry(*totals),
+        "rows": [
+            {**dict(zip(groups, row[:len(groups)])), **usage_entry(*row[len(groups):])}
+            for row in rows
+        ]
+    }
+
+Gauge("write_queue_depth", "Writes waiting for the write-behind queue", callback=lambda: write_queue.depth())
+Gauge("llm_summary_tasks", "Background conversation summaries in progress", callback=lambda: len(summary_tasks))
+Gauge("llm_circuit_open", "1 while the LLM circuit breaker is open or probing", callback=lambda: int(llm_breaker.state != "closed"))
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus metrics for this worker"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return Response(content="\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit/miss counters of the tutoring response cache and request coalescing"""
+    return {
+        "response_cache": response_cache.snapshot(),
+        "single_flight": llm_flight.snapshot(),
+        "near_duplicate": near_dup_index.snapshot(),
+        "lesson_library": lesson_library.snapshot()
+    }
+
 # Protected specialized learning endpoints
+PRONUNCIATION_BATCH_MAX_WORDS = int(os.getenv("PRONUNCIATION_BATCH_MAX_WORDS", "100"))
+PRONUNCIATION_BATCH_CONCURRENCY = int(os.getenv("PRONUNCIATION_BATCH_CONCURRENCY", "4"))
+PRONUNCIATION_PARAMS = {"max_tokens": 600, "temperature": 0.3}
+
+def pronunciation_messages(request: PronunciationRequest) -> List[dict]:
+    """Prompt for one word's pronunciation lesson"""
+    # Enhanced pronunciation prompt with cultural context
+    pronunciation_prompt = f"""
+    Siz ingliz tili talaffuzi bo'yicha mutaxassiz o'qituvchisiz. 
+    
+    "{request.word}" so'zining talaffuzini o'zbek o'quvchilariga o'rgating:
+    
+    1. So'zning ma'nosi (o'zbek tilida)
+    2. Fonetik yozuv (IPA belgisida) 
+    3. O'zbek tilida yaqin tovushlar bilan taqqoslash
+    4. Talaffuz uchun maslahatlar
+    5. Misol jumlalar (inglizcha va o'zbekcha tarjima bilan)
+    6. Umumiy xatolar va ulardan qanday saqlanish
+    
+    Javobni qisqa va amaliy qiling. O'zbek o'quvchisiga mos til ishlatingh.
+    """
+    
+    return [
+        {"role": "system", "content": pronunciation_prompt},
+        {"role": "user", "content": f"So'z: {request.word}"}
+    ]
+
 @app.post("/pronunciation")
 async def pronunciation_help(
     request: PronunciationRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(rate_limited_user)
 ):
     """Provide pronunciation help for English words (Protected)"""
     try:
-        if not client.api_key:
+        if not OPENAI_API_KEY:
             return {"error": "OpenAI API not configured"}
         
-        # Enhanced pronunciation prompt with cultural context
-        pronunciation_prompt = f"""
-        Siz ingliz tili talaffuzi bo'yicha mutaxassiz o'qituvchisiz. 
-        
-        "{request.word}" so'zining talaffuzini o'zbek o'quvchilariga o'rgating:
-        
-        1. So'zning ma'nosi (o'zbek tilida)
-        2. Fonetik yozuv (IPA belgisida) 
-        3. O'zbek tilida yaqin tovushlar bilan taqqoslash
-        4. Talaffuz uchun maslahatlar
-        5. Misol jumlalar (inglizcha va o'zbekcha tarjima bilan)
-        6. Umumiy xatolar va ulardan qanday saqlanish
-        
-        Javobni qisqa va amaliy qiling. O'zbek o'quvchisiga mos til ishlatingh.
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": pronunciation_prompt},
-                {"role": "user", "content": f"So'z: {request.word}"}
-            ],
-            max_tokens=600,
-            temperature=0.3
+        pronunciation = await cached_completion(
+            "pronunciation",
+            (request.word,),
+            messages=pronunciation_messages(request),
+            **PRONUNCIATION_PARAMS
         )
         
-        return {"pronunciation_help": response.choices[0].message.content}
+        return {"pronunciation_help": pronunciation}
         
     except Exception as e:
         return {"error": "Talaffuz yordamini olishda xatolik yuz berdi"}
 
+@app.post("/pronunciation/batch")
+async def pronunciation_batch(
+    request: PronunciationBatchRequest,
+    http_request: Request,
+    current_user: dict = Depends(rate_limited_user)
+):
+    """Pronunciation help for a word list, streamed per word as NDJSON (or SSE) (Protected)
+    
+    The call itself takes one request from the per-minute limit; every word that needs the LLM
+    is charged to the daily quota, and words beyond it come back as rate-limited error frames.
+    """
+    if not OPENAI_API_KEY:
+        return {"error": "OpenAI API not configured"}
+    
+    # Deduplicate on the same normalization the response cache uses, keeping the first spelling
+    items = []
+    seen = set()
+    for word in request.words:
+        normalized = normalize_cache_text(word)
+        if normalized and normalized not in seen:
+            seen.add(normalized)
+            items.append(PronunciationRequest(word=word.strip()))
+    
+    if len(items) > PRONUNCIATION_BATCH_MAX_WORDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Bir so'rovda ko'pi bilan {PRONUNCIATION_BATCH_MAX_WORDS} ta so'z yuborish mumkin"
+        )
+    
+    plan = current_user.get("subscription_plan") or "free"
+    
+    use_sse = wants_event_stream(http_request)
+    
+    def frame(data: dict, event: Optional[str] = None) -> str:
+        if use_sse:
+            return sse_event(data, event=event)
+        return json.dumps(data, ensure_ascii=False) + "\n"
+    
+    async def generate(index: int, item: PronunciationRequest, key: str, slots: asyncio.Semaphore) -> dict:
+        async with slots:
+            try:
+                pronunciation = await complete_and_cache(
+                    "pronunciation", key, pronunciation_messages(item), **PRONUNCIATION_PARAMS
+                )
+                return {"index": index, "word": item.word, "pronunciation_help": pronunciation, "cached": False}
+            except Exception as e:
+                print(f"Error in pronunciation_batch for {item.word!r}: {str(e)}")
+                return {"index": index, "word": item.word, "error": "Talaffuz yordamini olishda xatolik yuz berdi"}
+    
+    async def result_stream():
+        counts = {"words": len(items), "cached": 0, "generated": 0, "failed": 0, "rate_limited": 0}
+        
+        # Cached words go out immediately and cost nothing extra
+        uncached = []
+        for index, item in enumerate(items):
+            key = response_cache.make_key("pronunciation", item.word)
+            cached = response_cache.get(key)
+            if cached is not None:
+                counts["cached"] += 1
+                yield frame({"index": index, "word": item.word, "pronunciation_help": cached, "cached": True})
+            else:
+                uncached.append((index, item, key))
+        
+        # Words that need the LLM are charged to the daily quota, so batching cannot get around it
+        admitted = rate_limiter.reserve_daily(current_user["id"], plan, len(uncached))
+        for index, item, _ in uncached[admitted:]:
+            counts["rate_limited"] += 1
+            yield frame({
+                "index": index, "word": item.word, "rate_limited": True,
+                "error": "Kunlik limit tugadi. Ertaga qayta urinib ko'ring yoki Premium rejaga o'ting"
+            })
+        
+        # The rest fan out to the LLM with bounded concurrency
+        slots = asyncio.Semaphore(PRONUNCIATION_BATCH_CONCURRENCY)
+        pending = [asyncio.create_task(generate(index, item, key, slots)) for index, item, key in uncached[:admitted]]
+        
+        try:
+            for next_result in asyncio.as_completed(pending):
+                result = await next_result
+                counts["failed" if "error" in result else "generated"] += 1
+                yield frame(result)
+        finally:
+            # Client went away: stop the words that have not started yet
+            for task in pending:
+                task.cancel()
+        
+        yield frame(counts, event="done")
+    
+    return StreamingResponse(
+        result_stream(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/grammar-check")
 async def grammar_correction(
     request: GrammarRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(rate_limited_user)
 ):
     """Check and correct grammar for Uzbek students (Protected)"""
     try:
-        if not client.api_key:
+        if not OPENAI_API_KEY:
             return {"error": "OpenAI API not configured"}
         
         grammar_prompt = f"""
@@ -817,8 +3460,9 @@ async def grammar_correction(
         O'zbek tilida tushuntiring.
         """
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        grammar_help = await cached_completion(
+            "grammar-check",
+            (request.uzbek_sentence,),
             messages=[
                 {"role": "system", "content": grammar_prompt},
                 {"role": "user", "content": request.uzbek_sentence}
@@ -827,26 +3471,29 @@ async def grammar_correction(
             temperature=0.2
         )
         
-        return {"grammar_help": response.choices[0].message.content}
+        return {"grammar_help": grammar_help}
         
     except Exception as e:
         return {"error": "Grammatika tekshirishda xatolik yuz berdi"}
 
-@app.post("/lesson")
-async def structured_lesson(
-    request: LessonRequest,
-    current_user: dict = Depends(get_current_user)
-):
-    """Generate structured English lesson (Protected)"""
-    try:
-        if not client.api_key:
-            return {"error": "OpenAI API not configured"}
-        
-        lesson_prompt = f"""
+# Lesson library: catalog topics x levels are generated ahead of time (generate_lessons.py and a
+# scheduled background pass) so /lesson only calls the LLM for topics outside the catalog
+LESSON_CATALOG_PATH = os.getenv("LESSON_CATALOG_PATH", "lesson_catalog.json")
+LESSON_MAX_AGE_DAYS = float(os.getenv("LESSON_MAX_AGE_DAYS", "30"))  # Older lessons are regenerated
+LESSON_GENERATION_CONCURRENCY = int(os.getenv("LESSON_GENERATION_CONCURRENCY", "2"))
+LESSON_REFRESH_INTERVAL = int(os.getenv("LESSON_REFRESH_INTERVAL", "21600"))  # Seconds between background passes; 0 = off
+LESSON_REFRESH_BATCH = int(os.getenv("LESSON_REFRESH_BATCH", "50"))  # Lessons per background pass
+LESSON_PROMPT_VERSION = 1  # Bump when lesson_messages changes so stored lessons are regenerated
+LESSON_COMPLETION_PARAMS = {"max_tokens": 1000, "temperature": 0.4}
+LESSON_LEVELS = ("beginner", "intermediate", "advanced")
+
+def lesson_messages(topic: str, level: str) -> List[dict]:
+    """Prompt for one structured lesson"""
+    lesson_prompt = f"""
         Siz professional ingliz tili o'qituvchisisiz. O'zbek o'quvchilari uchun strukturali dars tayyorlang.
         
-        Mavzu: {request.topic}
-        Daraja: {request.level}
+        Mavzu: {topic}
+        Daraja: {level}
         
         Dars rejasi:
         1. Maqsad va vazifalar
@@ -859,18 +3506,201 @@ async def structured_lesson(
         
         Barcha tushuntirishlarni o'zbek tilida bering. Inglizcha misollardan keyin o'zbekcha tarjima qo'shing.
         """
+    return [
+        {"role": "system", "content": lesson_prompt},
+        {"role": "user", "content": f"Mavzu: {topic}, Daraja: {level}"}
+    ]
+
+def load_lesson_catalog(path: str) -> dict:
+    """{(topic_key, level): topic} for every catalog topic at every level it is offered in"""
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    default_levels = catalog.get("levels", LESSON_LEVELS)
+    entries = {}
+    for item in catalog["topics"]:
+        topic, levels = (item, default_levels) if isinstance(item, str) else (item["topic"], item["levels"])
+        for level in levels:
+            entries[(normalize_cache_text(topic), normalize_cache_text(level))] = topic
+    return entries
+
+def write_library_lesson(cursor: sqlite3.Cursor, topic_key: str, level: str, topic: str, content: str,
+                         model: str, generated_at: str):
+    cursor.execute("""
+        INSERT INTO lesson_library (topic_key, level, topic, content, model, prompt_version, generated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (topic_key, level) DO UPDATE SET
+            topic = excluded.topic,
+            content = excluded.content,
+            model = excluded.model,
+            prompt_version = excluded.prompt_version,
+            generated_at = excluded.generated_at
+    """, (topic_key, level, topic, content, model, LESSON_PROMPT_VERSION, generated_at))
+
+def claim_job_lease(name: str, seconds: float) -> bool:
+    """Take (or renew) a named lease so only one worker across the deployment runs the job"""
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    now = time.time()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO job_leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE job_leases.expires_at < ? OR job_leases.holder = excluded.holder
+            RETURNING holder
+        """, (name, holder, now + seconds, now))
+        return cursor.fetchone() is not None
+
+class LessonLibrary:
+    """Indexed store of pregenerated lessons with a bounded, resumable batch generator"""
+    
+    def __init__(self, catalog_path: str):
+        self.catalog_path = catalog_path
+        self._catalog = None
+        self._refresh_task = None
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0}
+    
+    @property
+    def catalog(self) -> dict:
+        if self._catalog is None:
+            try:
+                self._catalog = load_lesson_catalog(self.catalog_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Lesson catalog unavailable: {str(e)}")
+                self._catalog = {}
+        return self._catalog
+    
+    def catalog_topic(self, topic: str, level: str) -> Optional[str]:
+        """Canonical catalog spelling of a requested topic, or None for uncatalogued topics"""
+        return self.catalog.get((normalize_cache_text(topic), normalize_cache_text(level)))
+    
+    def get(self, topic: str, level: str) -> Optional[str]:
+        """Stored lesson for a topic and level (current prompt version only)"""
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT content FROM lesson_library
+                WHERE topic_key = ? AND level = ? AND prompt_version = ?
+            """, (normalize_cache_text(topic), normalize_cache_text(level), LESSON_PROMPT_VERSION))
+            row = cursor.fetchone()
+        self.stats["hits" if row else "misses"] += 1
+        return row[0] if row else None
+    
+    def store(self, topic: str, level: str, content: str, model: str = None):
+        write_queue.submit(
+            write_library_lesson, normalize_cache_text(topic), normalize_cache_text(level), topic, content,
+            model or LLM_MODEL, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        )
+    
+    def pending(self, max_age_days: float = LESSON_MAX_AGE_DAYS, force: bool = False) -> list:
+        """[(topic, level)] still to generate: missing first, then stale (old, other prompt version or model)"""
+        cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT topic_key, level, model, prompt_version, generated_at FROM lesson_library")
+            stored = {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+        
+        missing, stale = [], []
+        for (topic_key, level), topic in self.catalog.items():
+            row = stored.get((topic_key, level))
+            if row is None:
+                missing.append((topic, level))
+            elif force or row[0] != LLM_MODEL or row[1] != LESSON_PROMPT_VERSION or row[2] < cutoff:
+                stale.append((row[2], topic, level))
+        return missing + [(topic, level) for _, topic, level in sorted(stale)]
+    
+    async def generate(self, pairs: list, concurrency: int = LESSON_GENERATION_CONCURRENCY, on_result=None) -> dict:
+        """Generate and store lessons with at most `concurrency` upstream calls at a time
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": lesson_prompt},
-                {"role": "user", "content": f"Mavzu: {request.topic}, Daraja: {request.level}"}
-            ],
-            max_tokens=1000,
-            temperature=0.4
+        Each lesson is stored as soon as it is ready, so an interrupted run resumes from pending().
+        """
+        slots = asyncio.Semaphore(max(concurrency, 1))
+        counts = {"generated": 0, "failed": 0}
+        
+        async def generate_one(topic: str, level: str):
+            async with slots:
+                try:
+                    response = await llm_chat(messages=lesson_messages(topic, level), **LESSON_COMPLETION_PARAMS)
+                    content = response.choices[0].message.content
+                    if not content:
+                        raise ValueError("empty lesson")
+                    self.store(topic, level, content)
+                    outcome, error = "generated", None
+                except Exception as e:
+                    outcome, error = "failed", e
+            counts[outcome] += 1
+            self.stats[outcome] += 1
+            lesson_generation_total.inc(outcome=outcome)
+            if on_result:
+                on_result(topic, level, error)
+        
+        await asyncio.gather(*(generate_one(topic, level) for topic, level in pairs))
+        return counts
+    
+    async def refresh(self, limit: int = LESSON_REFRESH_BATCH) -> dict:
+        """One scheduled pass: the most out-of-date lessons first, at most `limit` of them"""
+        pairs = (await asyncio.to_thread(self.pending))[:limit]
+        return await self.generate(pairs) if pairs else {"generated": 0, "failed": 0}
+    
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(LESSON_REFRESH_INTERVAL)
+            try:
+                # Every worker wakes up; the lease lets one of them do the pass
+                if await asyncio.to_thread(claim_job_lease, "lesson-refresh", LESSON_REFRESH_INTERVAL * 0.9):
+                    counts = await self.refresh()
+                    if counts["generated"] or counts["failed"]:
+                        print(f"Lesson library refresh: {counts['generated']} generated, {counts['failed']} failed")
+            except Exception as e:
+                print(f"Error refreshing lesson library: {str(e)}")
+    
+    def start(self):
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+    
+    def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+    
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "catalog_lessons": len(self.catalog),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+lesson_library = LessonLibrary(LESSON_CATALOG_PATH)
+
+@app.post("/lesson")
+async def structured_lesson(
+    request: LessonRequest,
+    current_user: dict = Depends(rate_limited_user)
+):
+    """Generate structured English lesson (Protected)"""
+    try:
+        lesson = lesson_library.get(request.topic, request.level)
+        if lesson is not None:
+            lesson_library_total.inc(outcome="library")
+            return {"lesson": lesson}
+        
+        if not OPENAI_API_KEY:
+            return {"error": "OpenAI API not configured"}
+        
+        # A catalog lesson that has not been generated yet is generated now and kept in the library
+        catalog_topic = lesson_library.catalog_topic(request.topic, request.level)
+        topic = catalog_topic or request.topic
+        level = normalize_cache_text(request.level) if catalog_topic else request.level
+        lesson = await cached_completion(
+            "lesson",
+            (topic, level),
+            messages=lesson_messages(topic, level),
+            **LESSON_COMPLETION_PARAMS
         )
+        if catalog_topic and lesson:
+            lesson_library.store(catalog_topic, level, lesson)
+        lesson_library_total.inc(outcome="catalog_miss" if catalog_topic else "live")
         
-        return {"lesson": response.choices[0].message.content}
+        return {"lesson": lesson}
         
     except Exception as e:
         return {"error": "Dars tayyorlashda xatolik yuz berdi"}
@@ -878,11 +3708,11 @@ async def structured_lesson(
 @app.post("/image-learn")
 async def image_learning(
     request: ImageLearningRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(rate_limited_user)
 ):
     """Learn English from images with cultural context (Protected)"""
     try:
-        if not client.api_key:
+        if not OPENAI_API_KEY:
             return {"error": "OpenAI API not configured"}
         
         # Note: This would need OpenAI Vision API for full implementation
@@ -909,11 +3739,11 @@ async def image_learning(
 @app.post("/proverb-translate")
 async def proverb_translation(
     request: ProverbRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(rate_limited_user)
 ):
     """Translate Uzbek proverbs and find English equivalents (Protected)"""
     try:
-        if not client.api_key:
+        if not OPENAI_API_KEY:
             return {"error": "OpenAI API not configured"}
         
         proverb_prompt = f"""
@@ -932,8 +3762,9 @@ async def proverb_translation(
         O'zbek va ingliz madaniyatlarini bog'lab tushuntiring.
         """
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        proverb_analysis = await cached_completion(
+            "proverb-translate",
+            (request.uzbek_proverb,),
             messages=[
                 {"role": "system", "content": proverb_prompt},
                 {"role": "user", "content": request.uzbek_proverb}
@@ -942,7 +3773,7 @@ async def proverb_translation(
             temperature=0.3
         )
         
-        return {"proverb_analysis": response.choices[0].message.content}
+        return {"proverb_analysis": proverb_analysis}
         
     except Exception as e:
         return {"error": "Maqol tarjimasida xatolik yuz berdi"}
@@ -963,22 +3794,21 @@ async def update_profile(
 ):
     """Update user profile information"""
     try:
-        conn = sqlite3.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        
-        # Update user information
-        if user_update.full_name:
-            cursor.execute(
-                "UPDATE users SET full_name = ? WHERE id = ?",
-                (user_update.full_name, current_user["id"])
-            )
-        
-        conn.commit()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Update user information
+            if user_update.full_name:
+                cursor.execute(
+                    "UPDATE users SET full_name = ? WHERE id = ?",
+                    (user_update.full_name, current_user["id"])
+                )
+            
+            # Get updated user data
+            cursor.execute("SELECT * FROM users WHERE id = ?", (current_user["id"],))
+            updated_user = cursor.fetchone()
         
-        # Get updated user data
-        cursor.execute("SELECT * FROM users WHERE id = ?", (current_user["id"],))
-        updated_user = cursor.fetchone()
-        conn.close()
+        invalidate_user_cache(current_user["email"])
         
         return {
             "id": updated_user[0],
@@ -996,39 +3826,24 @@ async def update_profile(
 async def get_user_stats(current_user: dict = Depends(get_current_user)):
     """Get user usage statistics"""
     try:
-        conn = sqlite3.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        
-        # Get total chat sessions
-        cursor.execute(
-            "SELECT COUNT(*) FROM chat_sessions WHERE user_id = ?",
-            (current_user["id"],)
-        )
-        total_chats = cursor.fetchone()[0]
-        
-        # Get total messages
-        cursor.execute("""
-            SELECT COUNT(*) FROM chat_messages cm
-            JOIN chat_sessions cs ON cm.session_id = cs.id
-            WHERE cs.user_id = ?
-        """, (current_user["id"],))
-        total_messages = cursor.fetchone()[0]
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # A streak survives until the end of the day after the last active day
+            cursor.execute("""
+                SELECT total_chats, total_messages,
+                       CASE WHEN last_active_date >= DATE('now', '-1 day') THEN current_streak ELSE 0 END
+                FROM user_stats
+                WHERE user_id = ?
+            """, (current_user["id"],))
+            row = cursor.fetchone()
         
-        # Calculate streak days (simplified - days with activity in last 30 days)
-        cursor.execute("""
-            SELECT COUNT(DISTINCT DATE(cs.created_at)) as streak_days
-            FROM chat_sessions cs
-            WHERE cs.user_id = ? 
-            AND cs.created_at >= datetime('now', '-30 days')
-        """, (current_user["id"],))
-        streak_days = cursor.fetchone()[0]
+        total_chats, total_messages, streak_days = row if row else (0, 0, 0)
         
         # Estimate total time (simplified calculation)
         # Assume average 2 minutes per message
         estimated_time = total_messages * 2 * 60  # in seconds
         
-        conn.close()
-        
         return {
             "total_chats": total_chats,
             "total_messages": total_messages,
@@ -1047,45 +3862,32 @@ async def submit_feedback(
 ):
     """Submit user feedback"""
     try:
-        conn = sqlite3.connect(DATABASE_URL)
-        cursor = conn.cursor()
-        
-        # Create feedback table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                rating INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                message TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # Insert feedback
-        cursor.execute("""
-            INSERT INTO feedback (user_id, rating, type, message)
-            VALUES (?, ?, ?, ?)
-        """, (current_user["id"], feedback.rating, feedback.type, feedback.message))
-        
-        conn.commit()
-        conn.close()
+        write_queue.submit(write_feedback, current_user["id"], feedback.rating, feedback.type, feedback.message)
         
         return {"message": "Feedback submitted successfully"}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error submitting feedback: {str(e)}")
 
+def write_feedback(cursor: sqlite3.Cursor, user_id: int, rating: int, feedback_type: str, message: str):
+    """Store one feedback entry"""
+    cursor.execute("""
+        INSERT INTO feedback (user_id, rating, type, message)
+        VALUES (?, ?, ?, ?)
+    """, (user_id, rating, feedback_type, message))
+
 @app.get("/subscription-info")
 async def get_subscription_info(current_user: dict = Depends(get_current_user)):
     """Get user subscription information"""
     try:
+        plan = current_user.get("subscription_plan") or "free"
         return {
             "plan": current_user.get("subscription_plan", "free"),
             "expires": current_user.get("subscription_expires"),
+            "limits": rate_limiter.limits_for(plan),
+            "usage_today": rate_limiter.usage(current_user["id"], plan),
             "features": {
-                "unlimited_chats": current_user.get("subscription_plan") == "premium",
+                "higher_limits": current_user.get("subscription_plan") == "premium",
                 "file_uploads": current_user.get("subscription_plan") == "premium",
                 "voice_messages": current_user.get("subscription_plan") == "premium",
                 "advanced_features": current_user.get("subscription_plan") == "premium"
@@ -1116,5 +3918,6 @@ async def upgrade_subscription(
         raise HTTPException(status_code=500, detail=f"Error upgrading subscription: {str(e)}")
 
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port) 
\ No newline at end of file
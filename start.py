@@ -2,13 +2,29 @@
 """
 Aspiro AI Startup Script
 Bu skript Aspiro AI ilovasini ishga tushirish uchun mo'ljallangan.
+
+    python start.py               # Ishlab chiqish serveri (bitta jarayon)
+    python start.py --production  # gunicorn + uvicorn workerlari, har bir CPU uchun bittadan
 """
 
+import argparse
+import importlib.util
+import math
 import os
 import sys
-import subprocess
 from pathlib import Path
 
+# Production server settings (environment variables override the defaults)
+KEEPALIVE_SECONDS = int(os.getenv("SERVER_KEEPALIVE", 75))  # Longer than the platform load balancer's idle timeout
+BACKLOG = int(os.getenv("SERVER_BACKLOG", 2048))  # Pending connections the kernel queues during bursts
+MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", 10000))  # Recycle a worker after this many requests (0 = never)
+MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", 1000))  # So workers do not all restart together
+GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))  # Seconds a recycled worker gets to finish streams
+WORKER_TIMEOUT = int(os.getenv("SERVER_WORKER_TIMEOUT", 120))  # Restart a worker that stops heartbeating this long
+
+def has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
 def check_python_version():
     """Python versiyasini tekshirish"""
     if sys.version_info < (3, 8):
@@ -20,19 +36,24 @@ def check_python_version():
 
 def check_dependencies():
     """Bog'liqliklarni tekshirish"""
-    try:
-        import fastapi
-        import openai
-        import uvicorn
-        print("✅ Barcha bog'liqliklar o'rnatilgan")
-        return True
-    except ImportError as e:
-        print(f"❌ Bog'liqlik topilmadi: {e}")
+    missing = [name for name in ("fastapi", "openai", "uvicorn") if not has_module(name)]
+    if missing:
+        print(f"❌ Bog'liqlik topilmadi: {', '.join(missing)}")
         print("   Quyidagi komandani bajaring: pip install -r requirements.txt")
         return False
+    print("✅ Barcha bog'liqliklar o'rnatilgan")
+    return True
 
-def check_env_file():
+def check_env_file(production: bool = False):
     """Environment faylini tekshirish"""
+    if production and not Path(".env").exists():
+        # Hosting platformalarida kalitlar .env faylida emas, muhit o'zgaruvchilarida bo'ladi
+        if not (os.getenv("OPENAI_API_KEY") or os.getenv("REPLIT_SECRET")):
+            # Ilova kalitsiz ham ishlaydi, faqat AI funksiyalari o'chiq bo'ladi
+            print("⚠️  OPENAI_API_KEY muhit o'zgaruvchisi sozlanmagan: AI funksiyalari o'chirilgan holda ishga tushiriladi")
+            return True
+        print("✅ Environment o'zgaruvchilari to'g'ri sozlangan")
+        return True
     if not Path(".env").exists():
         print("⚠️  .env fayli topilmadi")
         print("   env.example faylidan nusxa ko'chiring va API kalitingizni qo'shing")
@@ -90,8 +111,89 @@ def start_server():
         print(f"\n❌ Server xatosi: {e}")
         print("   Qo'shimcha yordam uchun README.md faylini o'qing")
 
+def available_cpus() -> int:
+    """Jarayonga ajratilgan CPU yadrolari soni (konteyner kvotasi hisobga olinadi)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    
+    # cgroup v2 CPU quota, e.g. "200000 100000" = 2 CPUs; os.cpu_count() reports the host's cores
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY yoki CPU soni: workerlar asinxron, shuning uchun yadroga bitta yetarli"""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.getenv("WEB_CONCURRENCY")))
+    return available_cpus()
+
+def prepare_production():
+    """Workerlar ishga tushishidan oldin bir marta: migratsiyalar va static fayllar"""
+    import build_assets
+    import main as app_module
+    
+    app_module.prepare_database()
+    app_module.db_pool.close()
+    build_assets.load_or_build(Path("."))
+    print(f"✅ Ma'lumotlar bazasi tayyor (schema v{app_module.get_schema_version()})")
+
+def start_production_server(workers: int, port: int):
+    """Production serverni ishga tushirish"""
+    prepare_production()
+    # Workers skip init_database: the schema is already current and they must not race on it
+    os.environ["SKIP_DB_INIT"] = "1"
+    
+    loop = "uvloop" if has_module("uvloop") else "asyncio"
+    http = "httptools" if has_module("httptools") else "h11"
+    print(f"\n🚀 Aspiro AI production rejimida: {workers} ta worker, port {port}, loop={loop}, http={http}")
+    
+    if has_module("gunicorn"):
+        # UvicornWorker picks uvloop/httptools itself when they are installed
+        command = [
+            sys.executable, "-m", "gunicorn", "main:app",
+            "--worker-class", "uvicorn.workers.UvicornWorker",
+            "--workers", str(workers),
+            "--bind", f"0.0.0.0:{port}",
+            "--keep-alive", str(KEEPALIVE_SECONDS),
+            "--backlog", str(BACKLOG),
+            "--max-requests", str(MAX_REQUESTS),
+            "--max-requests-jitter", str(MAX_REQUESTS_JITTER),
+            "--graceful-timeout", str(GRACEFUL_TIMEOUT),
+            "--timeout", str(WORKER_TIMEOUT),
+            "--access-logfile", "-",
+        ]
+        sys.stdout.flush()
+        os.execv(sys.executable, command)
+    
+    # Without gunicorn (e.g. on Windows) uvicorn supervises the workers itself, but it does not
+    # replace workers that exit, so request-count recycling stays off
+    print("⚠️  gunicorn topilmadi: workerlar uvicorn bilan ishga tushiriladi, qayta ishga tushirish o'chirilgan")
+    import uvicorn
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=KEEPALIVE_SECONDS,
+        backlog=BACKLOG,
+    )
+
 def main():
     """Asosiy funksiya"""
+    parser = argparse.ArgumentParser(description="Aspiro AI serverini ishga tushirish")
+    parser.add_argument("--production", action="store_true", help="bir nechta worker bilan production rejimi")
+    parser.add_argument("--workers", type=int, default=None, help="worker soni (standart: WEB_CONCURRENCY yoki CPU soni)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    args = parser.parse_args()
+    
     print("🎓 Aspiro AI - Startup Script")
     print("=" * 40)
     
@@ -99,13 +201,16 @@ def main():
     checks = [
         check_python_version(),
         check_dependencies(),
-        check_env_file(),
+        check_env_file(production=args.production),
         check_static_files()
     ]
     
     if all(checks):
         print("\n✅ Barcha tekshiruvlar muvaffaqiyatli!")
-        start_server()
+        if args.production:
+            start_production_server(args.workers or default_workers(), args.port)
+        else:
+            start_server()
     else:
         print("\n❌ Ba'zi muammolar topildi. Iltimos, yuqoridagi ko'rsatmalarni bajaring.")
         print("   Qo'shimcha yordam uchun README.md faylini o'qing.")
@@ -413,8 +413,8 @@ async function sendMessage(message) {
     setInputState(false);
     
     try {
-        // Send to API with authentication
-        const response = await fetch('/chat', {
+        // Send to API with authentication (answer is streamed as it is generated)
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: getAuthHeaders(),
             body: JSON.stringify({ message: message })
@@ -429,13 +429,8 @@ async function sendMessage(message) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        
-        // Hide typing indicator
-        hideTypingIndicator();
-        
-        // Add AI response to chat
-        addMessageToChat(data.response, 'ai');
+        // Render tokens as they arrive
+        await renderStreamedResponse(response);
         
     } catch (error) {
         console.error('Error sending message:', error);
@@ -452,7 +447,7 @@ async function sendMessage(message) {
 }
 
 // Chat UI Functions
-function addMessageToChat(message, sender, attachments = null) {
+function addMessageToChat(message, sender, attachments = null, save = true) {
     const messageContainer = document.createElement('div');
     messageContainer.className = `message-container ${sender === 'user' ? 'user-container user-turn' : 'ai-turn'}`;
     
@@ -564,7 +559,60 @@ function addMessageToChat(message, sender, attachments = null) {
     scrollToBottom();
     
     // Save to history
-    saveChatMessage(message, sender, attachments);
+    if (save) {
+        saveChatMessage(message, sender, attachments);
+    }
+    
+    return messageContainer;
+}
+
+// Read a Server-Sent Events chat response and render tokens as they arrive
+async function renderStreamedResponse(response) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answer = '';
+    let finalAnswer = null;
+    let textElement = null;
+    
+    const showText = (text) => {
+        if (!textElement) {
+            hideTypingIndicator();
+            const container = addMessageToChat('', 'ai', null, false);
+            textElement = container.querySelector('.message-text');
+        }
+        textElement.innerHTML = formatMessage(text);
+        scrollToBottom();
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        
+        for (const rawEvent of events) {
+            const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+            if (!dataLine) continue;
+            
+            const payload = JSON.parse(dataLine.slice(6));
+            if (payload.delta) {
+                answer += payload.delta;
+                showText(answer);
+            } else if (payload.response !== undefined) {
+                finalAnswer = payload.response;
+            } else if (payload.error) {
+                finalAnswer = payload.error;
+            }
+        }
+    }
+    
+    // The server sends the assembled answer last; fall back to what was streamed
+    const fullAnswer = finalAnswer !== null ? finalAnswer : answer;
+    showText(fullAnswer);
+    saveChatMessage(fullAnswer, 'ai');
 }
 
 function addErrorMessage(message) {
@@ -1683,7 +1731,8 @@ async function sendMessageWithAttachments(message) {
         const response = await fetch('/chat-with-files', {
             method: 'POST',
             headers: {
-                'Authorization': `Bearer ${accessToken}`
+                'Authorization': `Bearer ${accessToken}`,
+                'Accept': 'text/event-stream'
             },
             body: formData
         });
@@ -1697,10 +1746,7 @@ async function sendMessageWithAttachments(message) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        
-        hideTypingIndicator();
-        addMessageToChat(data.response, 'ai');
+        await renderStreamedResponse(response);
         
     } catch (error) {
         console.error('Error sending message:', error);
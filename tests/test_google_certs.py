@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+
+import main
+
+AUDIENCE = "test-client.apps.googleusercontent.com"
+
+
+def make_key(key_id):
+    """RSA signer and the PEM certificate Google would publish for it"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, key_id)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    signer = crypt.RSASigner.from_string(private_pem, key_id=key_id)
+    return signer, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def make_token(signer, **claims):
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": AUDIENCE,
+        "sub": "1234567890",
+        "email": "student@example.com",
+        "email_verified": True,
+        "iat": now,
+        "exp": now + 3600,
+    }
+    payload.update(claims)
+    return google_jwt.encode(signer, payload).decode()
+
+
+class CertServer:
+    """Local stand-in for Google's certificate endpoint"""
+
+    def __init__(self):
+        self.certs = {}
+        self.fetches = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.fetches += 1
+                body = json.dumps(server.certs).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Cache-Control", "public, max-age=3600")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/certs"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def cert_server():
+    server = CertServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def signer(cert_server):
+    signer, cert = make_key("key-1")
+    cert_server.certs["key-1"] = cert
+    return signer
+
+
+def verify(cache, token):
+    async def run():
+        try:
+            return await cache.verify(token, AUDIENCE)
+        finally:
+            await cache.close()
+    return asyncio.run(run())
+
+
+def test_valid_token(cert_server, signer):
+    idinfo = verify(main.GoogleCertCache(cert_server.url), make_token(signer))
+    assert idinfo["email"] == "student@example.com"
+    assert cert_server.fetches == 1
+
+
+def test_wrong_audience_is_rejected(cert_server, signer):
+    with pytest.raises(ValueError):
+        verify(main.GoogleCertCache(cert_server.url), make_token(signer, aud="someone-else"))
+
+
+def test_wrong_issuer_is_rejected(cert_server, signer):
+    with pytest.raises(ValueError):
+        verify(main.GoogleCertCache(cert_server.url), make_token(signer, iss="https://evil.example.com"))
+
+
+def test_expired_token_is_rejected(cert_server, signer):
+    now = int(time.time())
+    with pytest.raises(ValueError):
+        verify(main.GoogleCertCache(cert_server.url), make_token(signer, iat=now - 7200, exp=now - 3600))
+
+
+def test_key_rotation_refetches_certs(cert_server, signer):
+    cache = main.GoogleCertCache(cert_server.url)
+
+    async def run():
+        try:
+            await cache.verify(make_token(signer), AUDIENCE)
+            rotated_signer, rotated_cert = make_key("key-2")
+            cert_server.certs["key-2"] = rotated_cert
+            return await cache.verify(make_token(rotated_signer), AUDIENCE)
+        finally:
+            await cache.close()
+
+    assert asyncio.run(run())["sub"] == "1234567890"
+    assert cert_server.fetches == 2
+
+
+def test_unknown_key_ids_refetch_at_most_once_per_interval(cert_server, signer):
+    cache = main.GoogleCertCache(cert_server.url)
+    forged_signer, _ = make_key("forged")
+
+    async def run():
+        rejected = 0
+        try:
+            for _ in range(20):
+                try:
+                    await cache.verify(make_token(forged_signer), AUDIENCE)
+                except ValueError:
+                    rejected += 1
+        finally:
+            await cache.close()
+        return rejected
+
+    assert asyncio.run(run()) == 20
+    # First download plus a single rotation check
+    assert cert_server.fetches == 2
+
+
+def test_close_allows_reuse_in_a_new_lifespan(cert_server, signer):
+    cache = main.GoogleCertCache(cert_server.url)
+    verify(cache, make_token(signer))
+    assert cache._http is None and cache._refresh_task is None
+    cache._expires_at = 0.0
+    assert verify(cache, make_token(signer))["sub"] == "1234567890"
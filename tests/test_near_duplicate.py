@@ -0,0 +1,46 @@
+import main
+
+
+def make_index():
+    index = main.NearDuplicateIndex(threshold=0.7, max_entries=100)
+    index.remember("12 ning kvadrat ildizi nechaga teng", "answer-12")
+    index.remember("past tense of go", "answer-go")
+    index.remember("2x+3=7 tenglamani yeching", "answer-equation")
+    index.remember("Pifagor teoremasi nima?", "answer-pythagoras")
+    return index
+
+
+def test_rephrased_question_is_served():
+    index = make_index()
+    assert index.lookup("What is the past tense of go?") == "answer-go"
+    assert index.lookup("12 ning kvadrat ildizi nechaga teng?") == "answer-12"
+
+
+def test_inflected_form_is_served():
+    assert make_index().lookup("pifagor teoremasini tushuntir") == "answer-pythagoras"
+
+
+def test_different_number_is_not_served():
+    index = make_index()
+    assert index.lookup("13 ning kvadrat ildizi nechaga teng") is None
+    assert index.lookup("2x+5=7 tenglamani yeching") is None
+
+
+def test_different_operator_is_not_served():
+    assert make_index().lookup("2x-3=7 tenglamani yeching") is None
+
+
+def test_single_key_word_change_is_not_served():
+    assert make_index().lookup("past tense of do") is None
+
+
+def test_signature_ignores_filler_case_and_script():
+    assert main.question_signature("Fotosintez nima? Tushuntir") == main.question_signature("fotosintez haqida tushuntiring")
+    assert main.question_signature("Фотосинтез нима?") == main.question_signature("fotosintez nima")
+
+
+def test_words_match_inflections_but_not_other_words():
+    assert main.words_match("teoremasi", "teoremasini")
+    assert main.words_match("teoremasi", "teoremani")
+    assert not main.words_match("go", "do")
+    assert not main.words_match("plant", "plane")
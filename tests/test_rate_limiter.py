@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+FREE_USER = {"id": 1, "email": "teacher@example.com", "subscription_plan": "free"}
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    monkeypatch.setattr(main.RateLimiter, "_load_day", staticmethod(lambda user_id, day: (0, 0)))
+    return main.RateLimiter(main.RATE_LIMITS, persist_interval=30)
+
+
+def test_reserve_daily_is_capped_by_the_remaining_quota(limiter, monkeypatch):
+    day_limit = main.RATE_LIMITS["free"]["requests_per_day"]
+    monkeypatch.setattr(main.RateLimiter, "_load_day", staticmethod(lambda user_id, day: (day_limit - 5, 0)))
+    assert limiter.reserve_daily(2, "free", 8) == 5
+    assert limiter.reserve_daily(2, "free", 1) == 0
+    assert limiter.usage(2, "free")["requests"] == day_limit
+
+
+@pytest.fixture
+def batch_client(monkeypatch, limiter):
+    monkeypatch.setattr(main, "rate_limiter", limiter)
+    monkeypatch.setattr(main, "OPENAI_API_KEY", "test-key")
+    cached_words = {"apple", "river"}
+    monkeypatch.setattr(main.response_cache, "get",
+                        lambda key: "cached help" if key.split(":")[-1] in cached_words else None)
+    monkeypatch.setattr(main.response_cache, "make_key", lambda endpoint, word: f"{endpoint}:{word}")
+
+    async def fake_completion(endpoint, key, messages, **params):
+        return f"help for {key}"
+
+    monkeypatch.setattr(main, "complete_and_cache", fake_completion)
+    main.app.dependency_overrides[main.rate_limited_user] = lambda: FREE_USER
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+
+def test_free_plan_batch_larger_than_the_minute_limit_is_accepted(batch_client, limiter):
+    words = ["apple", "river"] + [f"word{index}" for index in range(20)]
+    assert len(words) > main.RATE_LIMITS["free"]["requests_per_minute"]
+
+    response = batch_client.post("/pronunciation/batch", json={"words": words})
+    assert response.status_code == 200
+    frames = [json.loads(line) for line in response.text.splitlines() if line]
+
+    done = frames[-1]
+    assert done["cached"] == 2 and done["generated"] == 20 and done["rate_limited"] == 0
+    # Only the words that needed the LLM were charged
+    assert limiter.usage(FREE_USER["id"], "free")["requests"] == 20
+
+
+def test_batch_words_beyond_the_daily_quota_are_rate_limited(batch_client, monkeypatch):
+    day_limit = main.RATE_LIMITS["free"]["requests_per_day"]
+    monkeypatch.setattr(main.RateLimiter, "_load_day", staticmethod(lambda user_id, day: (day_limit - 3, 0)))
+
+    response = batch_client.post("/pronunciation/batch", json={"words": [f"word{index}" for index in range(5)]})
+    frames = [json.loads(line) for line in response.text.splitlines() if line]
+
+    assert sum(1 for frame in frames if frame.get("rate_limited") is True) == 2
+    assert frames[-1]["generated"] == 3
@@ -0,0 +1,25 @@
+import asyncio
+import threading
+
+import main
+
+
+def test_overflow_writes_run_on_the_writer_thread(monkeypatch):
+    threads = []
+
+    def fake_write_batch(self, batch):
+        threads.append((threading.current_thread().name, len(batch)))
+
+    monkeypatch.setattr(main.WriteBehindQueue, "_write_batch", fake_write_batch)
+    queue = main.WriteBehindQueue(max_batch=10, flush_interval=0.01, max_size=1)
+
+    async def run():
+        queue.start()
+        queue.submit(print, "queued")
+        queue.submit(print, "overflow")  # Queue is full: must not be written on the event loop
+        await queue.drain()
+
+    asyncio.run(run())
+    assert queue.stats["enqueued"] == 1 and queue.stats["overflow"] == 1 and queue.stats["inline"] == 0
+    assert len(threads) == 2
+    assert all(name.startswith("db-writer") for name, _ in threads)